@@ -0,0 +1,91 @@
+"""
+Micro-benchmark of datatype conversion cost per test result.
+
+before: the whole merged payload (per-test fields + static data) is converted for every result
+        with uncompiled regular expressions
+after:  static data is converted once per session, per result only per-test fields are converted
+
+    python benchmarks/bench_datatypes.py [number of results]
+"""
+import json
+import re
+import sys
+import timeit
+
+from pytest_xray.helper import TestResult, datatypes_converter
+
+STATIC_DATA = {
+    'suite': 'smoke and not slow',
+    'build': '1024',
+    'version': '3.14',
+    'branch': 'feature/xray-sync',
+    'debug': 'false',
+    'headless': 'true',
+    'environment': 'staging',
+    'browser': 'chrome',
+    'platform': 'linux',
+    'executor': 'ci-runner-17',
+}
+
+
+def legacy_datatypes_converter(payload: dict):
+    # implementation before precompiled conversion, kept as baseline
+    TRUE = 'true'
+    FALSE = 'false'
+    result = {}
+    for key, value in payload.items():
+        if value in (TRUE, FALSE):
+            if value == TRUE:
+                value = True
+            elif value == FALSE:
+                value = False
+        elif re.match(r"^\d+\.\d+$", str(value)):
+            value = float(value)
+        elif re.match(r"^\d+$", str(value)):
+            value = int(value)
+        result[key] = value
+    return result
+
+
+def before():
+    payload = dict(status='failed',
+                   longreprtext='E       AssertionError: Not passed',
+                   execution_time=0.125,
+                   tc_name='test_fail',
+                   jira_id='JIRA-2')
+    payload.update(STATIC_DATA)
+    return legacy_datatypes_converter(payload)
+
+
+CONVERTED_STATIC_DATA = datatypes_converter(STATIC_DATA)
+
+
+def after():
+    result = TestResult(nodeid='test_a.py::test_fail',
+                        test_key='JIRA-2',
+                        status='failed',
+                        comment='E       AssertionError: Not passed',
+                        duration=0.125,
+                        tc_name='test_fail',
+                        static_data=CONVERTED_STATIC_DATA)
+    return result.as_dict()
+
+
+def measure(func, number: int) -> float:
+    """ Best of 5 repeats, ns per result """
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+
+
+def main(number: int = 20000):
+    assert before() == after(), 'conversion results differ'
+    results = {
+        'results': number,
+        'before_ns_per_result': round(measure(before, number)),
+        'after_ns_per_result': round(measure(after, number)),
+    }
+    results['speedup'] = round(results['before_ns_per_result'] / results['after_ns_per_result'], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
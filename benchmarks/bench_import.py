@@ -0,0 +1,64 @@
+"""
+Benchmark of import cost of the plugin entry point, which is loaded by every pytest run.
+
+before: entry point imports plugin, publisher and HTTP stack (requests, urllib3)
+after:  entry point imports only option constants, the rest is imported when --xray-sync is set
+
+Each import is measured in fresh interpreter with `python -X importtime`, pytest itself is imported
+beforehand because it is loaded anyway.
+
+    python benchmarks/bench_import.py [number of runs]
+"""
+import statistics
+import subprocess
+import sys
+
+# what was imported by `pytest_xray.conftest` before imports became lazy
+BEFORE = 'pytest_xray.plugin, pytest_xray.xray_publisher, pytest_xray.helper, pytest_xray.spool'
+AFTER = 'pytest_xray.conftest'
+
+
+def import_time(modules: str) -> int:
+    """
+    Function to measure cumulative import time of modules in fresh interpreter
+    Args:
+        modules: str, comma separated modules
+
+    Returns:
+        int, microseconds
+    """
+    code = 'import pytest\nimport {}'.format(modules)
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    total = 0
+    started = False
+    for line in output.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if '|' not in line or 'imported package' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if name.strip() == 'pytest':
+            started = True
+            continue
+        if started and not name.startswith('  '):
+            # top-level imports after pytest
+            total += int(cumulative)
+    return total
+
+
+def heavy_modules(modules: str) -> list:
+    code = 'import sys\nimport pytest\nimport {}\nprint(",".join(m for m in ("requests", "urllib3") if m in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', code.format(modules)],
+                            stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    return [module for module in output.strip().split(',') if module]
+
+
+def main(runs: int = 10) -> None:
+    for name, modules in (('before', BEFORE), ('after', AFTER)):
+        timings = [import_time(modules) for _ in range(runs)]
+        print('{:6} median {:8.1f} ms, min {:8.1f} ms, imports HTTP stack: {}'.format(
+            name, statistics.median(timings) / 1000, min(timings) / 1000, heavy_modules(modules) or 'no'))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
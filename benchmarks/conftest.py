@@ -0,0 +1,41 @@
+import json
+import os
+import platform
+import time
+
+import pytest
+
+pytest_plugins = 'pytester'
+
+DEFAULT_SIZES = '1000,10000,100000'
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('pytest-xray benchmarks')
+    group.addoption('--bench-sizes', action='store', default=os.environ.get('XRAY_BENCH_SIZES', DEFAULT_SIZES),
+                    help='Comma separated sizes of synthetic suites')
+    group.addoption('--bench-latency', action='store', type=float, default=50.0,
+                    help='Latency in ms injected into mock XRAY server for upload benchmarks')
+    group.addoption('--bench-output', action='store', default='bench_output.json',
+                    help='Path to machine-readable JSON results')
+
+
+def pytest_generate_tests(metafunc):
+    if 'suite_size' in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption('--bench-sizes').split(',') if size.strip()]
+        metafunc.parametrize('suite_size', sizes)
+
+
+@pytest.fixture(scope='session')
+def bench_results(request):
+    """ Collects measurements: {suite size: {metric: value}}, written as JSON on the end of session """
+    results = {}
+    yield results
+    output = dict(meta=dict(timestamp=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                            python=platform.python_version(),
+                            pytest=pytest.__version__,
+                            platform=platform.platform(),
+                            latency_ms=request.config.getoption('--bench-latency')),
+                  results=results)
+    with open(request.config.getoption('--bench-output'), 'w') as output_file:
+        json.dump(output, output_file, indent=2, sort_keys=True)
@@ -0,0 +1,180 @@
+"""
+Benchmarks of pytest-xray-sync overhead and upload throughput.
+
+    python -m pytest benchmarks [--bench-sizes 1000,10000] [--bench-latency 50] [--bench-output bench_output.json]
+
+Plugin overhead is the difference between runs of the same synthetic suite with and without --xray-sync:
+time of collection (pytest_collection_modifyitems), of test loop (per-test hooks) and memory retained
+by the plugin at the end of session (results kept for upload). Upload throughput is measured against
+tests.mock_server.MockServer with injected latency.
+"""
+import time
+import tracemalloc
+
+import pytest
+
+from pytest_xray import constant, helper
+from pytest_xray.uploader import BackgroundUploader, ExecutionBatcher
+from pytest_xray.xray_publisher import XrayPublisher
+from tests.mock_server import MockServer
+
+MOCK_PORT = 5003
+TESTS_PER_MODULE = 1000
+INTERACTIVE_LIMIT = 10000
+
+
+class Probe:
+    """ Plugin for inner pytest run which measures phases of the session """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.timings = {}
+        self.retained_bytes = None
+
+    def _measure(self, name):
+        started = time.perf_counter()
+        yield
+        self.timings[name] = time.perf_counter() - started
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_collection(self, session):
+        yield from self._measure('collection_s')
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtestloop(self, session):
+        yield from self._measure('runtestloop_s')
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_sessionfinish(self, session):
+        if self.trace_memory:
+            # memory still allocated in plugin modules: kept results, static data, etc.
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, '*pytest_xray*')])
+            self.retained_bytes = sum(stat.size for stat in snapshot.statistics('filename'))
+        yield from self._measure('sessionfinish_s')
+
+
+@pytest.fixture(scope='session')
+def mock_url(request):
+    latency = request.config.getoption('--bench-latency') / 1000
+    server = MockServer(MOCK_PORT)
+
+    def slow_execution():
+        time.sleep(latency)
+        return {'testExecIssue': {'key': 'BENCH-1'}}
+
+    server.add_json_response(constant.TEST_EXECUTION_ENDPOINT, {'testExecIssue': {'key': 'BENCH-1'}},
+                             methods=('POST',))
+    server.add_callback_response('/slow' + constant.TEST_EXECUTION_ENDPOINT, slow_execution, methods=('POST',))
+    server.start()
+    time.sleep(0.5)
+    yield server.url
+    server.shutdown_server()
+
+
+def make_suite(testdir, size: int) -> None:
+    """ Synthetic suite: every test is marked with own Jira key, every 10th test fails """
+    for module in range(0, size, TESTS_PER_MODULE):
+        lines = ['import pytest', '']
+        for index in range(module, min(module + TESTS_PER_MODULE, size)):
+            lines += [f"@pytest.mark.xray('BENCH-{index}')",
+                      f"def test_{index}():",
+                      f"    assert {index % 10}, 'synthetic failure'",
+                      '']
+        testdir.makepyfile(**{f'test_bench_{module // TESTS_PER_MODULE}': '\n'.join(lines)})
+
+
+def run_suite(testdir, mock_url: str, xray: bool, trace_memory: bool = False) -> Probe:
+    probe = Probe(trace_memory)
+    args = ['-q', '-p', 'no:cacheprovider']
+    if xray:
+        args += [f'--{constant.ENABLE}', f'--{constant.OPTS.URL}', mock_url]
+    if trace_memory:
+        # one frame is enough for filtering by module and keeps tracing cheap
+        tracemalloc.start(1)
+    try:
+        testdir.runpytest_inprocess(*args, plugins=[probe])
+    finally:
+        if trace_memory:
+            probe.timings['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return probe
+
+
+def test_plugin_overhead(testdir, suite_size, mock_url, bench_results):
+    make_suite(testdir, suite_size)
+    baseline = run_suite(testdir, mock_url, xray=False)
+    plugin = run_suite(testdir, mock_url, xray=True)
+    memory = run_suite(testdir, mock_url, xray=True, trace_memory=True)
+
+    results = bench_results.setdefault(str(suite_size), {})
+    results.update(
+        collection_overhead_s=plugin.timings['collection_s'] - baseline.timings['collection_s'],
+        per_test_hook_overhead_us=(plugin.timings['runtestloop_s'] - baseline.timings['runtestloop_s'])
+        / suite_size * 1e6,
+        sessionfinish_upload_s=plugin.timings['sessionfinish_s'] - baseline.timings['sessionfinish_s'],
+        report_retained_bytes=memory.retained_bytes,
+        report_retained_bytes_per_test=memory.retained_bytes / suite_size,
+        peak_traced_bytes=memory.timings['peak_traced_bytes'],
+    )
+
+
+def make_execution(size: int) -> helper.TestExecution:
+    comment = 'E   AssertionError: synthetic failure\n' * 20
+    return helper.TestExecution(tests=[helper.TestCase(f'BENCH-{index}', helper.Status.FAIL, comment)
+                                       if not index % 10 else helper.TestCase(f'BENCH-{index}', helper.Status.PASS)
+                                       for index in range(size)])
+
+
+def test_upload_throughput(suite_size, mock_url, bench_results):
+    publisher = XrayPublisher(base_url=mock_url + '/slow', auth=None)
+    started = time.perf_counter()
+    publisher.publish_chunked(make_execution(suite_size),
+                              max_tests=constant.DEFAULT_CHUNK_SIZE,
+                              max_bytes=constant.DEFAULT_CHUNK_BYTES,
+                              workers=4)
+    elapsed = time.perf_counter() - started
+    publisher.close()
+    assert not publisher.errors
+
+    results = bench_results.setdefault(str(suite_size), {})
+    results.update(upload_s=elapsed,
+                   upload_tests_per_s=suite_size / elapsed,
+                   upload_requests=len(publisher.attempts))
+
+
+def test_concurrent_upload_throughput(suite_size, mock_url, bench_results):
+    publisher = XrayPublisher(base_url=mock_url + '/slow', auth=None, pool_size=16)
+    started = time.perf_counter()
+    publisher.publish_chunked(make_execution(suite_size),
+                              max_tests=constant.DEFAULT_CHUNK_SIZE,
+                              max_bytes=constant.DEFAULT_CHUNK_BYTES,
+                              workers=16)
+    elapsed = time.perf_counter() - started
+    publisher.close()
+    assert not publisher.errors
+
+    results = bench_results.setdefault(str(suite_size), {})
+    results.update(upload_concurrent_s=elapsed,
+                   upload_concurrent_tests_per_s=suite_size / elapsed)
+
+
+def test_interactive_throughput(suite_size, mock_url, bench_results):
+    size = min(suite_size, INTERACTIVE_LIMIT)
+    publisher = XrayPublisher(base_url=mock_url + '/slow', auth=None)
+    uploader = BackgroundUploader(publisher, batcher=ExecutionBatcher(max_size=100, max_delay=1.0))
+    uploader.start()
+    started = time.perf_counter()
+    for test in make_execution(size).tests:
+        uploader.submit(helper.TestExecution(tests=[test]))
+    enqueue_elapsed = time.perf_counter() - started
+    assert uploader.stop() == 0
+    elapsed = time.perf_counter() - started
+    publisher.close()
+    assert not publisher.errors
+
+    results = bench_results.setdefault(str(suite_size), {})
+    results.update(interactive_results=size,
+                   interactive_enqueue_us_per_result=enqueue_elapsed / size * 1e6,
+                   interactive_s=elapsed,
+                   interactive_results_per_s=size / elapsed,
+                   interactive_requests=len(publisher.attempts))
@@ -1,7 +1,6 @@
+# Entry point of the plugin is loaded by every pytest run, so only options are registered on import.
+# Publisher, HTTP stack (requests) and plugin itself are imported when the plugin is enabled
 import pytest_xray.constant as constants
-from .xray_publisher import XrayPublisher, PrintPublisher
-from pytest_xray.plugin import JiraXrayPlugin
-from pytest_xray.helper import ConfigManager
 
 OPTS = constants.OPTS
 
@@ -12,6 +11,20 @@ def pytest_addoption(parser):
         f'--{constants.ENABLE}',
         action='store_true',
         help='Push testruns to XRAY')
+    group.addoption(
+        f'--{constants.REPLAY}',
+        action='store',
+        default=None,
+        metavar='SPOOL',
+        help='Upload results from spool file which were not uploaded by test runs and exit')
+    group.addoption(
+        f'--{constants.FORCE_SYNC}',
+        action='store_true',
+        help='Push all results even if delta upload is enabled and refresh pushed state')
+    group.addoption(
+        f'--{constants.CACHE_CLEAR}',
+        action='store_true',
+        help='Clear cache of xray markers, see xr_collection_cache')
     group.addoption(
         f'--{OPTS.CONFIG}',
         action='store',
@@ -41,7 +54,7 @@ def pytest_addoption(parser):
         f'--{OPTS.TIMEOUT}',
         action='store',
         default=None,
-        help='XRAY connection timeout')
+        help='XRAY connect/read timeout in seconds: one number or "connect,read"')
     group.addoption(
         f'--{OPTS.INTERACTIVE}',
         action='store',
@@ -53,36 +66,382 @@ def pytest_addoption(parser):
         default=None,
         help='Push report only if at least one test passed (filter broken runs). '
              'works with xr_interactive_push=true only')
+    group.addoption(
+        f'--{OPTS.BACKGROUND_PUSH}',
+        action='store',
+        default=None,
+        help='Upload interactive pushes from a background thread (true/false)')
+    group.addoption(
+        f'--{OPTS.QUEUE_SIZE}',
+        action='store',
+        default=None,
+        help='Max number of pushes waiting in background upload queue')
+    group.addoption(
+        f'--{OPTS.DRAIN_TIMEOUT}',
+        action='store',
+        default=None,
+        help='Seconds to wait for background upload queue on the end of test run')
+    group.addoption(
+        f'--{OPTS.BATCH_SIZE}',
+        action='store',
+        default=None,
+        help='Max number of interactive results merged into one push, batches are pushed by background thread')
+    group.addoption(
+        f'--{OPTS.BATCH_INTERVAL}',
+        action='store',
+        default=None,
+        help='Max delay in ms of interactive result before its batch is pushed')
+    group.addoption(
+        f'--{OPTS.POOL_SIZE}',
+        action='store',
+        default=None,
+        help='Max number of kept-alive connections to XRAY')
+    group.addoption(
+        f'--{OPTS.CHUNK_SIZE}',
+        action='store',
+        default=None,
+        help='Max number of tests in one upload request, 0 - no limit')
+    group.addoption(
+        f'--{OPTS.CHUNK_BYTES}',
+        action='store',
+        default=None,
+        help='Max serialized size in bytes of tests in one upload request, 0 - no limit')
+    group.addoption(
+        f'--{OPTS.UPLOAD_WORKERS}',
+        action='store',
+        default=None,
+        help='Max number of concurrent chunk uploads into one test execution')
+    group.addoption(
+        f'--{OPTS.SPOOL}',
+        action='store',
+        default=None,
+        help='Path to append-only spool file with results, see --xr-replay')
+    group.addoption(
+        f'--{OPTS.RETRY_ATTEMPTS}',
+        action='store',
+        default=None,
+        help='Max number of attempts of one request to XRAY (429/503 responses, connection errors)')
+    group.addoption(
+        f'--{OPTS.RETRY_BACKOFF}',
+        action='store',
+        default=None,
+        help='Base of exponential backoff between attempts in seconds')
+    group.addoption(
+        f'--{OPTS.RETRY_BUDGET}',
+        action='store',
+        default=None,
+        help='Max total time in seconds spent on attempts of one request')
+    group.addoption(
+        f'--{OPTS.SERIALIZER}',
+        action='store',
+        default=None,
+        help='Serializer of request bodies: auto (orjson if installed), json, orjson')
+    group.addoption(
+        f'--{OPTS.COMPRESSION}',
+        action='store',
+        default=None,
+        help='Compression of request bodies: gzip, deflate. Disabled by default')
+    group.addoption(
+        f'--{OPTS.TIMING_SUMMARY}',
+        action='store',
+        default=None,
+        help='Print timing breakdown of the plugin on the end of test run (true/false)')
+    group.addoption(
+        f'--{OPTS.METRICS_FILE}',
+        action='store',
+        default=None,
+        help='Path to file with plugin metrics: Prometheus textfile for *.prom, JSON otherwise')
+    group.addoption(
+        f'--{OPTS.DELTA_UPLOAD}',
+        action='store',
+        default=None,
+        help='Push only results changed since the last push into the same test plan (true/false)')
+    group.addoption(
+        f'--{OPTS.PREFLIGHT}',
+        action='store',
+        default=None,
+        help='Check connectivity and credentials of XRAY on the start of test run (true/false)')
+    group.addoption(
+        f'--{OPTS.BREAKER_THRESHOLD}',
+        action='store',
+        default=None,
+        help='Number of consecutive failed pushes which opens circuit breaker, 0 - disabled')
+    group.addoption(
+        f'--{OPTS.BREAKER_RESET}',
+        action='store',
+        default=None,
+        help='Seconds before trial push when circuit breaker is open')
+    group.addoption(
+        f'--{OPTS.COMMENT_MODE}',
+        action='store',
+        default=None,
+        help='Comment of failed test: bounded (head and tail of traceback), signature (location and message of crash)')
+    group.addoption(
+        f'--{OPTS.COMMENT_HEAD}',
+        action='store',
+        default=None,
+        help='Max number of first characters of traceback in comment')
+    group.addoption(
+        f'--{OPTS.COMMENT_TAIL}',
+        action='store',
+        default=None,
+        help='Max number of last characters of traceback in comment')
+    group.addoption(
+        f'--{OPTS.DEDUP_FAILURES}',
+        action='store',
+        default=None,
+        help='Push traceback of identical failures once, other results refer to it (true/false)')
+    group.addoption(
+        f'--{OPTS.COLLECTION_CACHE}',
+        action='store',
+        default=None,
+        help='Keep xray markers of test modules in pytest cache, unchanged modules are not scanned (true/false)')
+    group.addoption(
+        f'--{OPTS.XRAY_EXECUTION_ID}',
+        action='store',
+        default=None,
+        help='Key of existing test execution to push results into')
+    group.addoption(
+        f'--{OPTS.XRAY_TEST_PLAN_ID}',
+        action='store',
+        default=None,
+        help='Key of test plan of created test execution')
+    group.addoption(
+        f'--{OPTS.PRECREATE_EXECUTION}',
+        action='store',
+        default=None,
+        help='Create test execution on the start of test run, so pushes of results are independent (true/false)')
+    group.addoption(
+        f'--{OPTS.PRIORITY_LANES}',
+        action='store',
+        default=None,
+        help='Push failures of interactive mode by batch caps, other results by bulk caps (true/false)')
+    group.addoption(
+        f'--{OPTS.BULK_BATCH_SIZE}',
+        action='store',
+        default=None,
+        help='Max number of not failed results merged into one push, 0 - push them on the end of test run')
+    group.addoption(
+        f'--{OPTS.BULK_BATCH_INTERVAL}',
+        action='store',
+        default=None,
+        help='Max delay in ms of not failed result before its batch is pushed')
+    group.addoption(
+        f'--{OPTS.SIDECAR}',
+        action='store',
+        default=None,
+        help='Upload results on the end of test run by detached process, pytest does not wait for Jira (true/false)')
+    group.addoption(
+        f'--{OPTS.SIDECAR_DIR}',
+        action='store',
+        default=None,
+        help='Directory of sidecar upload jobs and logs, see python -m pytest_xray.sidecar status')
+    group.addoption(
+        f'--{OPTS.RESULT_FILE}',
+        action='store',
+        default=None,
+        help='Write results of the end of test run into file (gzipped for *.gz) instead of push, see pytest-xray-merge')
+    group.addoption(
+        f'--{OPTS.CONCURRENCY}',
+        action='store',
+        default=None,
+        help='Max number of requests in flight to XRAY of all upload workers and background pushes, 0 - no limit')
+    group.addoption(
+        f'--{OPTS.RATE_LIMIT}',
+        action='store',
+        default=None,
+        help='Max number of requests per second to XRAY shared by all processes of the host, 0 - no limit')
+    group.addoption(
+        f'--{OPTS.RATE_BURST}',
+        action='store',
+        default=None,
+        help='Number of requests which may be sent at once before rate limit applies')
+    group.addoption(
+        f'--{OPTS.RATE_LIMIT_FILE}',
+        action='store',
+        default=None,
+        help='State file of rate limit, processes with the same file share the limit (default: per XRAY url in temp dir)')
 
     parser.addini(OPTS.CONFIG, 'Path to the config file containing information about the XRAY server')
     parser.addini(OPTS.USERNAME, 'Username for XRAY authentication')
     parser.addini(OPTS.PASSWORD, 'Passord for XRAY authentication')
     parser.addini(OPTS.URL, 'url or hostname to XRAY')
     parser.addini(OPTS.PORT, 'port or hostname to XRAY')
-    parser.addini(OPTS.TIMEOUT, 'XRAY connection timeout')
+    parser.addini(OPTS.TIMEOUT, 'XRAY connect/read timeout in seconds: one number or "connect,read"')
     parser.addini(OPTS.INTERACTIVE, 'Push report after each TC or on on the end of test run')
     parser.addini(OPTS.ALL_FAILS_ALLOWED, 'Push report only if at least one test passed (filter broken runs).')
+    parser.addini(OPTS.BACKGROUND_PUSH, 'Upload interactive pushes from a background thread')
+    parser.addini(OPTS.QUEUE_SIZE, 'Max number of pushes waiting in background upload queue')
+    parser.addini(OPTS.DRAIN_TIMEOUT, 'Seconds to wait for background upload queue on the end of test run')
+    parser.addini(OPTS.BATCH_SIZE,
+                  'Max number of interactive results merged into one push, batches are pushed by background thread')
+    parser.addini(OPTS.BATCH_INTERVAL, 'Max delay in ms of interactive result before its batch is pushed')
+    parser.addini(OPTS.POOL_SIZE, 'Max number of kept-alive connections to XRAY')
+    parser.addini(OPTS.CHUNK_SIZE, 'Max number of tests in one upload request, 0 - no limit')
+    parser.addini(OPTS.CHUNK_BYTES, 'Max serialized size in bytes of tests in one upload request, 0 - no limit')
+    parser.addini(OPTS.UPLOAD_WORKERS, 'Max number of concurrent chunk uploads into one test execution')
+    parser.addini(OPTS.SPOOL, 'Path to append-only spool file with results, see --xr-replay')
+    parser.addini(OPTS.RETRY_ATTEMPTS, 'Max number of attempts of one request to XRAY (429/503 responses, connection errors)')
+    parser.addini(OPTS.RETRY_BACKOFF, 'Base of exponential backoff between attempts in seconds')
+    parser.addini(OPTS.RETRY_BUDGET, 'Max total time in seconds spent on attempts of one request')
+    parser.addini(OPTS.SERIALIZER, 'Serializer of request bodies: auto (orjson if installed), json, orjson')
+    parser.addini(OPTS.COMPRESSION, 'Compression of request bodies: gzip, deflate. Disabled by default')
+    parser.addini(OPTS.TIMING_SUMMARY, 'Print timing breakdown of the plugin on the end of test run')
+    parser.addini(OPTS.METRICS_FILE, 'Path to file with plugin metrics: Prometheus textfile for *.prom, JSON otherwise')
+    parser.addini(OPTS.DELTA_UPLOAD, 'Push only results changed since the last push into the same test plan')
+    parser.addini(OPTS.PREFLIGHT, 'Check connectivity and credentials of XRAY on the start of test run')
+    parser.addini(OPTS.BREAKER_THRESHOLD, 'Number of consecutive failed pushes which opens circuit breaker, 0 - disabled')
+    parser.addini(OPTS.BREAKER_RESET, 'Seconds before trial push when circuit breaker is open')
+    parser.addini(OPTS.COMMENT_MODE, 'Comment of failed test: bounded (head and tail of traceback), signature')
+    parser.addini(OPTS.COMMENT_HEAD, 'Max number of first characters of traceback in comment')
+    parser.addini(OPTS.COMMENT_TAIL, 'Max number of last characters of traceback in comment')
+    parser.addini(OPTS.DEDUP_FAILURES, 'Push traceback of identical failures once, other results refer to it')
+    parser.addini(OPTS.COLLECTION_CACHE,
+                  'Keep xray markers of test modules in pytest cache, unchanged modules are not scanned')
+    parser.addini(OPTS.XRAY_EXECUTION_ID, 'Key of existing test execution to push results into')
+    parser.addini(OPTS.XRAY_TEST_PLAN_ID, 'Key of test plan of created test execution')
+    parser.addini(OPTS.PRECREATE_EXECUTION,
+                  'Create test execution on the start of test run, so pushes of results are independent')
+    parser.addini(OPTS.PRIORITY_LANES, 'Push failures of interactive mode by batch caps, other results by bulk caps')
+    parser.addini(OPTS.BULK_BATCH_SIZE,
+                  'Max number of not failed results merged into one push, 0 - push them on the end of test run')
+    parser.addini(OPTS.BULK_BATCH_INTERVAL, 'Max delay in ms of not failed result before its batch is pushed')
+    parser.addini(OPTS.SIDECAR, 'Upload results on the end of test run by detached process, pytest does not wait for Jira')
+    parser.addini(OPTS.SIDECAR_DIR, 'Directory of sidecar upload jobs and logs, see python -m pytest_xray.sidecar status')
+    parser.addini(OPTS.RESULT_FILE, 'Write results of the end of test run into file (gzipped for *.gz) instead of push')
+    parser.addini(OPTS.CONCURRENCY,
+                  'Max number of requests in flight to XRAY of all upload workers and background pushes, 0 - no limit')
+    parser.addini(OPTS.RATE_LIMIT,
+                  'Max number of requests per second to XRAY shared by all processes of the host, 0 - no limit')
+    parser.addini(OPTS.RATE_BURST, 'Number of requests which may be sent at once before rate limit applies')
+    parser.addini(OPTS.RATE_LIMIT_FILE, 'State file of rate limit, processes with the same file share the limit')
+
+
+def _get_publisher_settings(config_manager):
+    """ Options of publisher without password, they are passed to sidecar uploader as JSON """
+    from pytest_xray.serializer import AUTO
+
+    return dict(url=config_manager.getoption(OPTS.URL),
+                username=config_manager.getoption(OPTS.USERNAME),
+                verify=config_manager.getoption(OPTS.SSL_VERIFICATION, default=False, flag=True),
+                timeout=config_manager.get_timeout(OPTS.TIMEOUT),
+                pool_size=config_manager.get_int(OPTS.POOL_SIZE, default=constants.DEFAULT_POOL_SIZE),
+                retry=dict(max_attempts=config_manager.get_int(OPTS.RETRY_ATTEMPTS,
+                                                               default=constants.DEFAULT_RETRY_ATTEMPTS),
+                           backoff_base=config_manager.get_float(OPTS.RETRY_BACKOFF,
+                                                                 default=constants.DEFAULT_RETRY_BACKOFF),
+                           total_timeout=config_manager.get_float(OPTS.RETRY_BUDGET,
+                                                                  default=constants.DEFAULT_RETRY_BUDGET)),
+                serializer=config_manager.getoption(OPTS.SERIALIZER, default=AUTO),
+                compression=config_manager.getoption(OPTS.COMPRESSION),
+                breaker=dict(failure_threshold=config_manager.get_int(OPTS.BREAKER_THRESHOLD,
+                                                                      default=constants.DEFAULT_BREAKER_THRESHOLD),
+                             reset_timeout=config_manager.get_float(OPTS.BREAKER_RESET,
+                                                                    default=constants.DEFAULT_BREAKER_RESET)),
+                concurrency=config_manager.get_int(OPTS.CONCURRENCY, default=0),
+                rate_limit=dict(rate=config_manager.get_float(OPTS.RATE_LIMIT, default=0.0),
+                                burst=config_manager.get_int(OPTS.RATE_BURST, default=constants.DEFAULT_RATE_BURST),
+                                path=config_manager.getoption(OPTS.RATE_LIMIT_FILE)))
+
+
+def _build_publisher(config_manager, metrics=None):
+    from pytest_xray.xray_publisher import build_publisher
+
+    return build_publisher(_get_publisher_settings(config_manager),
+                           password=config_manager.getoption(OPTS.PASSWORD),
+                           metrics=metrics)
+
+
+def _get_chunk_options(config_manager):
+    return dict(max_tests=config_manager.get_int(OPTS.CHUNK_SIZE, default=constants.DEFAULT_CHUNK_SIZE),
+                max_bytes=config_manager.get_int(OPTS.CHUNK_BYTES, default=constants.DEFAULT_CHUNK_BYTES),
+                workers=config_manager.get_int(OPTS.UPLOAD_WORKERS, default=1))
+
+
+def pytest_cmdline_main(config):
+    spool_path = config.getoption(f'--{constants.REPLAY}')
+    if spool_path:
+        from pytest_xray.helper import ConfigManager
+        from pytest_xray.spool import ResultSpool, replay
+
+        config_manager = ConfigManager(config)
+        client = _build_publisher(config_manager)
+        if client.dry_run:
+            print("[JiraXrayPlugin] Replay requires url of XRAY ({}), results are kept in spool".format(OPTS.URL))
+            return 1
+        spool = ResultSpool(spool_path)
+        try:
+            uploaded = replay(spool, client, **_get_chunk_options(config_manager))
+        finally:
+            client.close()
+            spool.close()
+        print("[JiraXrayPlugin] Replayed results: {}".format(uploaded))
+        if client.errors:
+            print("[JiraXrayPlugin] Errors: {}".format("\n".join(client.errors)))
+            return 1
+        return 0
 
 
 def pytest_configure(config):
     if config.getoption(f'--{constants.ENABLE}'):
+        from pytest_xray.helper import ConfigManager
+        from pytest_xray.longrepr import get_comment_mode
+        from pytest_xray.metrics import Metrics
+        from pytest_xray.plugin import JiraXrayPlugin
+
         config_manager = ConfigManager(config)
-        # client = XrayPublisher(base_url=config_manager.getoption(OPTS.URL),
-        #                        auth=(config_manager.getoption(OPTS.USERNAME),
-        #                              config_manager.getoption(OPTS.PASSWORD)),
-        #                        verify=config_manager.getoption(OPTS.SSL_VERIFICATION, default=False, flag=True),
-        #                        )
-        client = PrintPublisher(base_url=config_manager.getoption(OPTS.URL),
-                                auth=(config_manager.getoption(OPTS.USERNAME),
-                                      config_manager.getoption(OPTS.PASSWORD)),
-                                verify=config_manager.getoption(OPTS.SSL_VERIFICATION, default=False, flag=True),
-                                )
+        # xdist workers forward results to controller and never push themselves
+        xdist_worker = hasattr(config, 'workerinput')
+        timing_summary = config_manager.getoption(OPTS.TIMING_SUMMARY, default=False, flag=True)
+        metrics_file = config_manager.getoption(OPTS.METRICS_FILE)
+        metrics = Metrics(enabled=bool(timing_summary or metrics_file))
+        client = None if xdist_worker else _build_publisher(config_manager, metrics)
+        if client and config_manager.getoption(OPTS.PREFLIGHT, default=False, flag=True):
+            error = client.check_connection()
+            if error:
+                print("[JiraXrayPlugin] Preflight check failed: {}. Results are deferred".format(error))
         config.pluginmanager.register(
             JiraXrayPlugin(api_client=client,
+                           xdist_worker=xdist_worker,
                            interactive_push=config_manager.getoption(OPTS.INTERACTIVE, default=False, flag=True),
                            all_fails_allowed=config_manager.getoption(OPTS.ALL_FAILS_ALLOWED, default=False, flag=True),
                            pytest_fields_to_push=config_manager.get_dict(OPTS.PYTEST_FIELDS),
                            osenv_fields_to_push=config_manager.get_dict(OPTS.OSENV_FIELDS),
+                           background_push=config_manager.getoption(OPTS.BACKGROUND_PUSH, default=False, flag=True),
+                           queue_size=config_manager.get_int(OPTS.QUEUE_SIZE, default=constants.DEFAULT_QUEUE_SIZE),
+                           drain_timeout=config_manager.get_float(OPTS.DRAIN_TIMEOUT,
+                                                                  default=constants.DEFAULT_DRAIN_TIMEOUT),
+                           batch_size=config_manager.get_int(OPTS.BATCH_SIZE, default=1),
+                           batch_interval=config_manager.get_float(OPTS.BATCH_INTERVAL,
+                                                                   default=constants.DEFAULT_BATCH_INTERVAL),
+                           priority_lanes=config_manager.getoption(OPTS.PRIORITY_LANES, default=False, flag=True),
+                           bulk_batch_size=config_manager.get_int(OPTS.BULK_BATCH_SIZE, default=0),
+                           bulk_batch_interval=config_manager.get_float(OPTS.BULK_BATCH_INTERVAL),
+                           chunk_options=_get_chunk_options(config_manager),
+                           result_file=config_manager.getoption(OPTS.RESULT_FILE),
+                           sidecar=dict(directory=config_manager.getoption(OPTS.SIDECAR_DIR,
+                                                                           default=constants.DEFAULT_SIDECAR_DIR),
+                                        settings=_get_publisher_settings(config_manager),
+                                        password=config_manager.getoption(OPTS.PASSWORD))
+                           if config_manager.getoption(OPTS.SIDECAR, default=False, flag=True) else None,
+                           spool=config_manager.getoption(OPTS.SPOOL),
+                           metrics=metrics,
+                           timing_summary=timing_summary,
+                           metrics_file=metrics_file,
+                           delta_upload=config_manager.getoption(OPTS.DELTA_UPLOAD, default=False, flag=True),
+                           force_sync=config.getoption(f'--{constants.FORCE_SYNC}'),
+                           comment_mode=get_comment_mode(config_manager.getoption(OPTS.COMMENT_MODE)),
+                           comment_head=config_manager.get_int(OPTS.COMMENT_HEAD,
+                                                               default=constants.DEFAULT_COMMENT_HEAD),
+                           comment_tail=config_manager.get_int(OPTS.COMMENT_TAIL,
+                                                               default=constants.DEFAULT_COMMENT_TAIL),
+                           dedup_failures=config_manager.getoption(OPTS.DEDUP_FAILURES, default=False, flag=True),
+                           collection_cache=config_manager.getoption(OPTS.COLLECTION_CACHE, default=False, flag=True),
+                           cache_clear=config.getoption(f'--{constants.CACHE_CLEAR}'),
+                           execution_id=config_manager.getoption(OPTS.XRAY_EXECUTION_ID),
+                           testplan_id=config_manager.getoption(OPTS.XRAY_TEST_PLAN_ID),
+                           precreate_execution=config_manager.getoption(OPTS.PRECREATE_EXECUTION, default=False,
+                                                                        flag=True),
                            ),
             # Name of plugin instance (allow to be used by other plugins)
             name=constants.XRAY_PLUGIN
@@ -1,10 +1,30 @@
 TEST_EXECUTION_ENDPOINT = '/rest/raven/2.0/import/execution'
+PREFLIGHT_ENDPOINT = '/rest/api/2/myself'
 DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
 XRAY_PLUGIN = "JIRA_XRAY"
 XRAY_MARKER_NAME = "xray"
 PREFIX = 'xr_'
 XRAY_CONFIG = 'xr_config'
 ENABLE = 'xray-sync'
+REPLAY = 'xr-replay'
+FORCE_SYNC = 'xr-force-sync'
+CACHE_CLEAR = 'xr-cache-clear'
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_DRAIN_TIMEOUT = 300.0
+DEFAULT_BATCH_INTERVAL = 1000
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RATE_BURST = 1
+DEFAULT_SIDECAR_DIR = '.xray_sidecar'
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_BYTES = 5 * 1024 * 1024
+DEFAULT_RETRY_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+DEFAULT_RETRY_BUDGET = 60.0
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_RESET = 30.0
+DEFAULT_PREFLIGHT_TIMEOUT = 5.0
+DEFAULT_COMMENT_HEAD = 2000
+DEFAULT_COMMENT_TAIL = 3000
 
 
 class MetaData(type):
@@ -22,11 +42,48 @@ class OPTS(metaclass=MetaData):
     URL = 'xr_url'
     PORT = "xr_port"
     TIMEOUT = 'xr_timeout'
-    XRAY_EXECUTION_ID = 'xr_testplan'
-    XRAY_TEST_PLAN_ID = "xr_execution_id"
+    XRAY_EXECUTION_ID = 'xr_execution_id'
+    XRAY_TEST_PLAN_ID = 'xr_testplan'
     INTERACTIVE = 'xr_interactive_push'
     ALL_FAILS_ALLOWED = 'xr_all_fails_allowed'
     PYTEST_FIELDS = 'xr_pytest_fields_to_push'
     OSENV_FIELDS = 'xr_osenv_fields_to_push'
     CONFIG = XRAY_CONFIG
     SSL_VERIFICATION = "xr_ssl_verification"
+    BACKGROUND_PUSH = 'xr_background_push'
+    QUEUE_SIZE = 'xr_queue_size'
+    DRAIN_TIMEOUT = 'xr_drain_timeout'
+    BATCH_SIZE = 'xr_batch_size'
+    BATCH_INTERVAL = 'xr_batch_interval'
+    POOL_SIZE = 'xr_pool_size'
+    CHUNK_SIZE = 'xr_chunk_size'
+    CHUNK_BYTES = 'xr_chunk_bytes'
+    UPLOAD_WORKERS = 'xr_upload_workers'
+    SPOOL = 'xr_spool'
+    RETRY_ATTEMPTS = 'xr_retry_attempts'
+    RETRY_BACKOFF = 'xr_retry_backoff'
+    RETRY_BUDGET = 'xr_retry_budget'
+    SERIALIZER = 'xr_serializer'
+    COMPRESSION = 'xr_compression'
+    TIMING_SUMMARY = 'xr_timing_summary'
+    METRICS_FILE = 'xr_metrics_file'
+    DELTA_UPLOAD = 'xr_delta_upload'
+    PREFLIGHT = 'xr_preflight'
+    BREAKER_THRESHOLD = 'xr_breaker_threshold'
+    BREAKER_RESET = 'xr_breaker_reset'
+    COMMENT_MODE = 'xr_comment_mode'
+    COMMENT_HEAD = 'xr_comment_head'
+    COMMENT_TAIL = 'xr_comment_tail'
+    DEDUP_FAILURES = 'xr_dedup_failures'
+    COLLECTION_CACHE = 'xr_collection_cache'
+    CONCURRENCY = 'xr_concurrency'
+    PRECREATE_EXECUTION = 'xr_precreate_execution'
+    PRIORITY_LANES = 'xr_priority_lanes'
+    BULK_BATCH_SIZE = 'xr_bulk_batch_size'
+    BULK_BATCH_INTERVAL = 'xr_bulk_batch_interval'
+    SIDECAR = 'xr_sidecar'
+    SIDECAR_DIR = 'xr_sidecar_dir'
+    RESULT_FILE = 'xr_result_file'
+    RATE_LIMIT = 'xr_rate_limit'
+    RATE_BURST = 'xr_rate_burst'
+    RATE_LIMIT_FILE = 'xr_rate_limit_file'
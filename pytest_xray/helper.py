@@ -3,7 +3,7 @@ import enum
 import configparser
 import os
 import re
-from typing import List, Dict, Union, Any
+from typing import List, Dict, Union, Any, Iterable, Iterator
 
 from .constant import XRAY_MARKER_NAME, DATETIME_FORMAT, PREFIX, XRAY_CONFIG
 
@@ -20,7 +20,75 @@ class Status(str, enum.Enum):
     BLOCKED = 'BLOCKED'
 
 
+# several results of one test case (e.g. parametrized test) are merged into the worst one
+STATUS_SEVERITY = {
+    Status.PASS: 0,
+    Status.TODO: 1,
+    Status.EXECUTING: 2,
+    Status.PENDING: 3,
+    Status.ABORTED: 4,
+    Status.BLOCKED: 5,
+    Status.FAIL: 6,
+}
+
+
+class TestResult:
+    """
+    Compact result of xray case. Static data of test run (CLI, ini, env and Settings fields)
+    is shared by all results instead of being copied into each of them
+    """
+    __slots__ = ('nodeid', 'test_key', 'status', 'comment', 'duration', 'tc_name', 'error_signature', 'static_data')
+
+    def __init__(self,
+                 nodeid: str,
+                 test_key: str,
+                 status: str,
+                 comment: str = '',
+                 duration: float = 0.0,
+                 tc_name: str = '',
+                 error_signature: str = None,
+                 static_data: Dict[str, Any] = None):
+        self.nodeid = nodeid
+        self.test_key = test_key
+        # pytest outcome: passed/failed/skipped
+        self.status = status
+        self.comment = comment
+        self.duration = duration
+        self.tc_name = tc_name
+        self.error_signature = error_signature
+        self.static_data = static_data if static_data is not None else {}
+
+    def with_key(self, test_key: str) -> 'TestResult':
+        """
+        Method to get copy of result for another Jira key of the same test (comment is shared, not copied)
+        """
+        return TestResult(self.nodeid, test_key, self.status, self.comment, self.duration, self.tc_name,
+                          self.error_signature, self.static_data)
+
+    def as_dict(self, convert_datatypes: bool = True) -> Dict[str, Any]:
+        """
+        Method to get flat payload of result merged with static data (built on demand only)
+        """
+        payload = dict(status=self.status,
+                       longreprtext=self.comment,
+                       execution_time=self.duration,
+                       tc_name=self.tc_name,
+                       jira_id=self.test_key)
+        if self.error_signature is not None:
+            payload.update(error_signature=self.error_signature)
+        if convert_datatypes:
+            # static data is converted once per session, see JiraXrayPlugin.__get_static_data
+            payload = datatypes_converter(payload)
+        payload.update(self.static_data)
+        return payload
+
+
+# {"testKey":"","status":"","comment":""} and comma between test cases
+TEST_CASE_JSON_OVERHEAD = 40
+
+
 class TestCase:
+    __slots__ = ('test_key', 'status', 'comment', 'duration', 'seqs')
 
     def __init__(self,
                  test_key: str,
@@ -31,6 +99,32 @@ class TestCase:
         self.status = Status(status)
         self.comment = comment or ''
         self.duration = duration
+        # sequence numbers of merged results in spool file (if spool is used)
+        self.seqs = ()
+
+    def merge(self, other: 'TestCase') -> None:
+        """
+        Method to merge result of the same test case, the worst status (and its comment) wins
+        Args:
+            other: TestCase, result to merge
+        """
+        if STATUS_SEVERITY[other.status] > STATUS_SEVERITY[self.status]:
+            self.status = other.status
+            self.comment = other.comment
+        self.duration += other.duration
+        self.seqs += other.seqs
+
+    def size(self) -> int:
+        """
+        Method to estimate size in bytes of serialized test case without serializing it.
+        Escaped characters of comment are counted, other control characters are not
+        Returns:
+            int
+        """
+        comment = self.comment
+        return (TEST_CASE_JSON_OVERHEAD + len(self.test_key) + len(self.status.value) + len(comment.encode('utf-8'))
+                + comment.count('\n') + comment.count('\r') + comment.count('\t')
+                + comment.count('"') + comment.count('\\'))
 
     def as_dict(self) -> Dict[str, str]:
         return dict(testKey=self.test_key,
@@ -38,6 +132,24 @@ class TestCase:
                     comment=self.comment)
 
 
+def merge_worst(tests: Iterable[TestCase]) -> List[TestCase]:
+    """
+    Function to merge results by Jira key, so each test case is pushed once with the worst status
+    Args:
+        tests: iterable of TestCase
+
+    Returns:
+        list of TestCase, in order of first result of each key
+    """
+    merged = {}
+    for test in tests:
+        if test.test_key in merged:
+            merged[test.test_key].merge(test)
+        else:
+            merged[test.test_key] = test
+    return list(merged.values())
+
+
 class TestExecution:
 
     def __init__(self,
@@ -58,6 +170,53 @@ class TestExecution:
             test = TestCase(**test)
         self.tests.append(test)
 
+    def merge(self, other: 'TestExecution') -> None:
+        """
+        Method to take over tests of another execution (batching of interactive pushes)
+        Args:
+            other: TestExecution, execution to merge into current one
+        """
+        self.tests.extend(other.tests)
+        self.start_date = min(self.start_date, other.start_date)
+        if not self.test_execution_key:
+            self.test_execution_key = other.test_execution_key
+
+    def split(self, max_tests: int = 0, max_bytes: int = 0) -> Iterator['TestExecution']:
+        """
+        Method to split execution into chunks limited by number of tests and by serialized size of tests.
+        Chunk contains at least one test even if it doesn't fit into size limit
+        Args:
+            max_tests: int, max number of tests in chunk, 0 - no limit
+            max_bytes: int, max size in bytes of serialized tests in chunk, 0 - no limit
+
+        Returns:
+            iterator of TestExecution
+        """
+        chunk, chunk_bytes = [], 0
+        for test in self.tests:
+            # estimated size, so body is serialized once by publisher
+            test_bytes = test.size() if max_bytes else 0
+            if chunk and ((max_tests and len(chunk) >= max_tests) or
+                          (max_bytes and chunk_bytes + test_bytes > max_bytes)):
+                yield self.with_tests(chunk)
+                chunk, chunk_bytes = [], 0
+            chunk.append(test)
+            chunk_bytes += test_bytes
+        if chunk:
+            yield self.with_tests(chunk)
+
+    def with_tests(self, tests: List[TestCase]) -> 'TestExecution':
+        """
+        Method to get execution with the same info and other tests (chunk, lane of results)
+        """
+        chunk = TestExecution(test_execution_key=self.test_execution_key,
+                              test_plan_key=self.test_plan_key,
+                              user=self.user,
+                              revision=self.revision,
+                              tests=tests)
+        chunk.start_date = self.start_date
+        return chunk
+
     def as_dict(self) -> Dict[str, Any]:
         tests = [test.as_dict() for test in self.tests]
         info = dict(startDate=self.start_date.strftime(DATETIME_FORMAT),
@@ -194,6 +353,55 @@ class ConfigManager:
             value = self.__covert_to_bool(value)
         return value
 
+    def get_int(self, opt_name: str, default: int = None) -> int:
+        """
+        Method to get integer parameter from any available source
+        Args:
+            opt_name: str, name of option
+            default: int, default value if option is not defined or not a number
+
+        Returns:
+            int
+        """
+        try:
+            return int(self.getoption(opt_name, default=default))
+        except (TypeError, ValueError):
+            return default
+
+    def get_float(self, opt_name: str, default: float = None) -> float:
+        """
+        Method to get float parameter from any available source
+        Args:
+            opt_name: str, name of option
+            default: float, default value if option is not defined or not a number
+
+        Returns:
+            float
+        """
+        try:
+            return float(self.getoption(opt_name, default=default))
+        except (TypeError, ValueError):
+            return default
+
+    def get_timeout(self, opt_name: str) -> Union[None, float, tuple]:
+        """
+        Method to get HTTP timeout. Value is either one number for connect and read timeouts
+        or two comma separated numbers: 'connect, read'
+        Args:
+            opt_name: str, name of option
+
+        Returns:
+            None/float/tuple
+        """
+        raw_value = self.getoption(opt_name)
+        if not raw_value:
+            return None
+        try:
+            timeouts = tuple(float(value) for value in str(raw_value).split(','))
+        except ValueError:
+            return None
+        return timeouts if len(timeouts) > 1 else timeouts[0]
+
     def get_list(self, option: str) -> list:
         """
         Method to get list values from DBSync plugin config file ONLY
@@ -231,19 +439,39 @@ class ConfigManager:
         return output_dict
 
 
+_FLOAT_RE = re.compile(r"^\d+\.\d+$")
+_INT_RE = re.compile(r"^\d+$")
+_BOOLEANS = {'true': True, 'false': False}
+_NATIVE_TYPES = (bool, int, float, type(None))
+
+
+def convert_value(value: Any) -> Any:
+    """
+    Function to convert string value to bool/float/int if it looks like one
+    Args:
+        value: any, value to convert
+
+    Returns:
+        converted value or value itself
+    """
+    if isinstance(value, _NATIVE_TYPES):
+        # conversion of these types always gives the same value
+        return value
+    if isinstance(value, str):
+        if value in _BOOLEANS:
+            return _BOOLEANS[value]
+        text = value
+    else:
+        text = str(value)
+    if not text or not text[0].isdecimal():
+        # fast path: both numeric patterns start with a digit
+        return value
+    if _FLOAT_RE.match(text):
+        return float(text)
+    if _INT_RE.match(text):
+        return int(text)
+    return value
+
+
 def datatypes_converter(payload: dict):
-        TRUE = 'true'
-        FALSE = 'false'
-        result = {}
-        for key, value in payload.items():
-            if value in (TRUE, FALSE):
-                if value == TRUE:
-                    value = True
-                elif value == FALSE:
-                    value = False
-            elif re.match(r"^\d+\.\d+$", str(value)):
-                value = float(value)
-            elif re.match(r"^\d+$", str(value)):
-                value = int(value)
-            result[key] = value
-        return result
\ No newline at end of file
+    return {key: convert_value(value) for key, value in payload.items()}
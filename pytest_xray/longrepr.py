@@ -0,0 +1,185 @@
+import hashlib
+import io
+import re
+from typing import Optional
+
+from _pytest._io import TerminalWriter
+from _pytest.reports import TestReport
+
+from .constant import DEFAULT_COMMENT_HEAD, DEFAULT_COMMENT_TAIL
+
+BOUNDED = 'bounded'
+SIGNATURE = 'signature'
+COMMENT_MODES = (BOUNDED, SIGNATURE)
+TRUNCATED = ' TRUNCATED '
+# exception type in the first line of crash message, e.g. "requests.exceptions.ConnectionError: ..."
+_ERROR_TYPE_RE = re.compile(r'^([\w.]+)(?::|$)')
+# parts of message which differ between identical failures: addresses, ports, ids, timings
+_VOLATILE_RE = re.compile(r'0x[0-9a-fA-F]+|\d+')
+# tail buffer keeps a bit more than budget, so trailing whitespace can be stripped
+_TAIL_SLACK = 256
+
+
+class BoundedText(io.TextIOBase):
+    """
+    Text sink which keeps only `head` first and `tail` last characters of written text,
+    so memory doesn't depend on size of rendered traceback. Leading and trailing whitespace
+    is stripped like in TestReport.longreprtext
+    """
+
+    def __init__(self, head: int, tail: int) -> None:
+        super().__init__()
+        self._head_budget = head
+        self._tail_budget = tail
+        # tail is compacted when it grows twice over its limit, so compaction cost is amortized
+        self._tail_limit = tail + _TAIL_SLACK
+        self._head = []
+        self._head_size = 0
+        self._tail = []
+        self._tail_size = 0
+        self._size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        written = len(text)
+        if self._head_size >= self._head_budget:
+            # fast path: head is complete
+            self._size += written
+            self._tail.append(text)
+            self._tail_size += written
+            if self._tail_size > 2 * self._tail_limit:
+                self._compact()
+            return written
+        if not self._size:
+            text = text.lstrip()
+        self._size += len(text)
+        part = text[:self._head_budget - self._head_size]
+        self._head.append(part)
+        self._head_size += len(part)
+        if len(part) < len(text):
+            self._tail.append(text[len(part):])
+            self._tail_size += len(text) - len(part)
+        return written
+
+    def _compact(self) -> None:
+        tail = ''.join(self._tail)[-self._tail_limit:]
+        self._tail = [tail]
+        self._tail_size = len(tail)
+
+    def getvalue(self) -> str:
+        head = ''.join(self._head)
+        tail = ''.join(self._tail)[-self._tail_limit:]
+        stripped_tail = tail.rstrip()
+        size = self._size - (len(tail) - len(stripped_tail))
+        if size <= self._head_budget + self._tail_budget:
+            return (head + stripped_tail).rstrip()
+        return head + TRUNCATED + (stripped_tail[-self._tail_budget:] if self._tail_budget else '')
+
+
+def bounded_longrepr(report: TestReport, head: int = DEFAULT_COMMENT_HEAD, tail: int = DEFAULT_COMMENT_TAIL) -> str:
+    """
+    Function to render failure of report with head and tail budget. Text is rendered straight from
+    longrepr objects into bounded sink instead of building whole `longreprtext`
+    Args:
+        report: TestReport, report
+        head: int, max number of first characters
+        tail: int, max number of last characters
+
+    Returns:
+        str, `head` first characters, ' TRUNCATED ' and `tail` last characters of text if text exceeds budget
+    """
+    if report.longrepr is None:
+        return ''
+    sink = BoundedText(head, tail)
+    writer = TerminalWriter(sink)
+    writer.hasmarkup = False
+    report.toterminal(writer)
+    return sink.getvalue()
+
+
+def failure_signature(report: TestReport, head: int = DEFAULT_COMMENT_HEAD) -> str:
+    """
+    Function to get short description of failure: location and message of crash ("path:line: message")
+    or reason of skip
+    Args:
+        report: TestReport, report
+        head: int, max length of signature
+
+    Returns:
+        str
+    """
+    longrepr = report.longrepr
+    if longrepr is None:
+        return ''
+    if isinstance(longrepr, tuple) and len(longrepr) == 3:
+        # skip: (path, lineno, reason)
+        return str(longrepr[2])[:head]
+    reprcrash = getattr(longrepr, 'reprcrash', None)
+    if reprcrash is None:
+        return bounded_longrepr(report, head, 0)
+    return '{}:{}: {}'.format(reprcrash.path, reprcrash.lineno, reprcrash.message)[:head]
+
+
+def error_signature(report: TestReport) -> Optional[str]:
+    """
+    Function to get signature of failure: exception type and hash of normalized crash message
+    and frames below test function, so the same failure of different tests has the same signature
+    Args:
+        report: TestReport, report
+
+    Returns:
+        str, e.g. 'ConnectionError:3f2a9c1b12de', None if report has no traceback
+    """
+    longrepr = report.longrepr
+    reprcrash = getattr(longrepr, 'reprcrash', None)
+    if reprcrash is None:
+        return None
+    first_line = reprcrash.message.split('\n', 1)[0]
+    match = _ERROR_TYPE_RE.match(first_line)
+    error_type = match.group(1) if match else 'Failure'
+    entries = getattr(getattr(longrepr, 'reprtraceback', None), 'reprentries', None) or []
+    frames = []
+    # the outermost frame is test function (or fixture) itself
+    for entry in entries[1:] or entries:
+        location = getattr(entry, 'reprfileloc', None)
+        if location is not None:
+            frames.append('{}:{}'.format(location.path, location.lineno))
+    if not frames:
+        frames.append('{}:{}'.format(reprcrash.path, reprcrash.lineno))
+    digest = hashlib.sha1('\n'.join([_VOLATILE_RE.sub('#', first_line)] + frames).encode('utf-8')).hexdigest()
+    return '{}:{}'.format(error_type, digest[:12])
+
+
+def get_comment_mode(name: str = None) -> str:
+    """
+    Function to validate comment mode option
+    Args:
+        name: str, 'bounded', 'signature' or empty (bounded)
+
+    Returns:
+        str
+    """
+    mode = (name or BOUNDED).lower()
+    if mode not in COMMENT_MODES:
+        raise ValueError("Unsupported comment mode: '{}'".format(name))
+    return mode
+
+
+def capture_comment(report: TestReport, mode: str = BOUNDED, head: int = DEFAULT_COMMENT_HEAD,
+                    tail: int = DEFAULT_COMMENT_TAIL) -> str:
+    """
+    Function to get comment of test result from report
+    Args:
+        report: TestReport, report
+        mode: str, 'bounded' - head and tail of traceback, 'signature' - location and message of crash
+        head: int, budget of first characters
+        tail: int, budget of last characters
+
+    Returns:
+        str
+    """
+    if mode == SIGNATURE:
+        return failure_signature(report, head)
+    return bounded_longrepr(report, head, tail)
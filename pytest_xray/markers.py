@@ -0,0 +1,151 @@
+import os
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from _pytest.nodes import Item
+
+from .constant import XRAY_MARKER_NAME
+
+CACHE_KEY = 'pytest_xray/markers'
+
+
+def get_marker_keys(item: Item) -> Tuple[str, ...]:
+    """
+    Function to get Jira keys of item from xray markers of function, class and module.
+    Marker takes one or several keys:
+        @pytest.mark.xray('JIRA-1', 'JIRA-2')
+        pytestmark = pytest.mark.xray('JIRA-10')
+    Args:
+        item: Item, pytest item
+
+    Returns:
+        tuple, unique keys, the closest markers first
+    """
+    keys = {}
+    for marker in item.iter_markers(XRAY_MARKER_NAME):
+        for arg in marker.args:
+            for key in ([arg] if isinstance(arg, str) else arg):
+                keys[key] = None
+    return tuple(keys)
+
+
+class MarkerCache:
+    """
+    Jira keys of nodes kept in pytest cache (.pytest_cache) between sessions, per test module:
+        {"/repo/tests/test_a.py": {"stamp": [mtime_ns, size], "keys": {"tests/test_a.py::test_one": ["JIRA-1"]}}}
+    Markers of module are resolved again only if module file is changed. Markers added dynamically
+    (e.g. by hooks in conftest.py) are not tracked, such changes require --xr-cache-clear
+    """
+
+    def __init__(self, cache) -> None:
+        self._cache = cache
+        self._modules: Dict[str, dict] = cache.get(CACHE_KEY, {})
+        self._changed = False
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _stamp(path: str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def clear(self) -> None:
+        self._modules = {}
+        self._changed = True
+
+    def resolve(self, items: Iterable[Item]) -> Iterator[Tuple[str, Tuple[str, ...]]]:
+        """
+        Method to get Jira keys of items, from cache for unchanged modules
+        Args:
+            items: iterable of Item
+
+        Returns:
+            iterator of (nodeid, keys) pairs
+        """
+        checked = set()
+        for item in items:
+            path = str(item.fspath)
+            if path not in checked:
+                checked.add(path)
+                stamp = self._stamp(path)
+                module = self._modules.get(path)
+                if module is None or module['stamp'] != stamp:
+                    self._modules[path] = dict(stamp=stamp, keys={})
+                    self._changed = True
+            module_keys = self._modules[path]['keys']
+            keys = module_keys.get(item.nodeid)
+            if keys is None:
+                keys = module_keys[item.nodeid] = get_marker_keys(item)
+                self._changed = True
+                self.misses += 1
+            else:
+                self.hits += 1
+            yield item.nodeid, tuple(keys)
+
+    def save(self) -> None:
+        if self._changed:
+            self._cache.set(CACHE_KEY, self._modules)
+            self._changed = False
+
+
+class MarkerIndex:
+    """
+    Index of xray markers: nodeid -> Jira keys and reverse Jira key -> nodeids
+    (several nodeids of parametrized test share one key). Built once on collection,
+    xdist controller fills it from reports of workers
+    """
+
+    def __init__(self) -> None:
+        self._keys: Dict[str, Tuple[str, ...]] = {}
+        self._nodeids: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, nodeid: str) -> bool:
+        return nodeid in self._keys
+
+    def add(self, nodeid: str, keys: Iterable[str]) -> None:
+        """
+        Method to index keys of node
+        Args:
+            nodeid: str, pytest node id
+            keys: iterable, Jira keys of node
+        """
+        keys = tuple(keys)
+        if not keys or self._keys.get(nodeid) == keys:
+            return
+        for key in self._keys.get(nodeid, ()):
+            self._nodeids[key].remove(nodeid)
+        self._keys[nodeid] = keys
+        for key in keys:
+            self._nodeids.setdefault(key, []).append(nodeid)
+
+    def build(self, items: Iterable[Item], cache: MarkerCache = None) -> None:
+        """
+        Method to index markers of collected items
+        Args:
+            items: iterable of Item
+            cache: MarkerCache, keys of unchanged modules are taken from cache if set
+        """
+        if cache is not None:
+            pairs = cache.resolve(items)
+        else:
+            pairs = ((item.nodeid, get_marker_keys(item)) for item in items)
+        for nodeid, keys in pairs:
+            self.add(nodeid, keys)
+
+    def keys_of(self, nodeid: str) -> Tuple[str, ...]:
+        return self._keys.get(nodeid, ())
+
+    def nodeids_of(self, key: str) -> List[str]:
+        return self._nodeids.get(key, [])
+
+    def test_keys(self) -> Iterator[str]:
+        """
+        Returns:
+            iterator of Jira keys in order of collection
+        """
+        return (key for key, nodeids in self._nodeids.items() if nodeids)
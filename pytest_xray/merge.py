@@ -0,0 +1,201 @@
+"""
+Result files of test run shards and their merge into one test execution.
+
+Each shard writes its results with `xr_result_file` instead of pushing them, then results of all shards
+are merged (worst status of each Jira key wins) and uploaded as one test execution:
+
+    pytest-xray-merge shard-*.jsonl.gz --url https://jira --username user --workers 4
+
+Password is taken from XRAY_PASSWORD environment variable. Result file is JSON Lines, gzipped if name ends
+with .gz: header line with info of test execution and one line per result:
+    {"format": "pytest-xray-results", "version": 1, "test_execution_key": "", "test_plan_key": "", ...}
+    ["JIRA-1", "PASS", "", 0.01]
+"""
+import argparse
+import datetime as dt
+import gzip
+import json
+import logging
+import os
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .constant import (
+    DATETIME_FORMAT,
+    DEFAULT_CHUNK_BYTES,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_RATE_BURST,
+    DEFAULT_RETRY_ATTEMPTS,
+    DEFAULT_RETRY_BACKOFF,
+    DEFAULT_RETRY_BUDGET,
+)
+from .helper import TestCase, TestExecution
+
+FORMAT = 'pytest-xray-results'
+VERSION = 1
+PASSWORD_ENV = 'XRAY_PASSWORD'
+
+_log = logging.getLogger(__name__)
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def write_result_file(path: str, test_execution: TestExecution, append: bool = False) -> None:
+    """
+    Function to write results of test run into result file
+    Args:
+        path: str, result file, gzipped if name ends with .gz
+        test_execution: TestExecution, results
+        append: bool, add results to file written by the same run
+    """
+    with _open(path, 'a' if append else 'w') as result_file:
+        if not append:
+            header = dict(format=FORMAT,
+                          version=VERSION,
+                          test_execution_key=test_execution.test_execution_key or '',
+                          test_plan_key=test_execution.test_plan_key,
+                          user=test_execution.user,
+                          revision=test_execution.revision,
+                          start_date=test_execution.start_date.strftime(DATETIME_FORMAT))
+            result_file.write(json.dumps(header) + '\n')
+        for test in test_execution.tests:
+            result_file.write(json.dumps([test.test_key, test.status.value, test.comment, test.duration]) + '\n')
+
+
+def read_result_file(path: str) -> Tuple[dict, Iterator[TestCase]]:
+    """
+    Function to read result file lazily
+    Args:
+        path: str, result file
+
+    Returns:
+        tuple, header and iterator of results
+    """
+    result_file = _open(path, 'r')
+    try:
+        header = json.loads(result_file.readline() or '{}')
+    except ValueError:
+        header = {}
+    if header.get('format') != FORMAT:
+        result_file.close()
+        raise ValueError('{} is not a result file of pytest-xray-sync'.format(path))
+
+    def tests() -> Iterator[TestCase]:
+        with result_file:
+            for line in result_file:
+                if line.strip():
+                    yield TestCase(*json.loads(line))
+
+    return header, tests()
+
+
+def merge_result_files(paths: Iterable[str], test_execution_key: str = None,
+                       test_plan_key: str = None) -> TestExecution:
+    """
+    Function to merge results of shards, results are streamed, so only the worst result of each Jira key is kept
+    in memory
+    Args:
+        paths: result files
+        test_execution_key: str, test execution to upload into, default is the one of shards
+        test_plan_key: str, test plan of created test execution, default is the one of shards
+
+    Returns:
+        TestExecution, results in order of the first result of each key
+    """
+    merged: Dict[str, TestCase] = {}
+    headers = []
+    for path in paths:
+        header, tests = read_result_file(path)
+        headers.append(header)
+        for test in tests:
+            if test.test_key in merged:
+                merged[test.test_key].merge(test)
+            else:
+                merged[test.test_key] = test
+
+    def from_headers(name: str) -> Optional[str]:
+        return next((header[name] for header in headers if header.get(name)), None)
+
+    test_execution = TestExecution(test_execution_key=test_execution_key or from_headers('test_execution_key'),
+                                   test_plan_key=test_plan_key or from_headers('test_plan_key'),
+                                   user=from_headers('user'),
+                                   revision=from_headers('revision'),
+                                   tests=list(merged.values()))
+    start_dates = [dt.datetime.strptime(header['start_date'], DATETIME_FORMAT)
+                   for header in headers if header.get('start_date')]
+    if start_dates:
+        # merged execution starts with the first shard
+        test_execution.start_date = min(start_dates)
+    return test_execution
+
+
+def main(argv: List[str] = None) -> int:
+    from .xray_publisher import build_publisher
+
+    parser = argparse.ArgumentParser(prog='pytest-xray-merge',
+                                     description='Merge result files of test run shards and upload them '
+                                                 'as one test execution')
+    parser.add_argument('files', nargs='+', help='Result files written by xr_result_file')
+    parser.add_argument('--url', help='Jira url, without url merged execution is printed (dry run)')
+    parser.add_argument('--username', help='Jira user, password is taken from {}'.format(PASSWORD_ENV))
+    parser.add_argument('--execution-id', help='Key of existing test execution to upload into')
+    parser.add_argument('--testplan', help='Key of test plan of created test execution')
+    parser.add_argument('--verify', action='store_true', help='Verify SSL certificate of Jira')
+    parser.add_argument('--timeout', type=float, default=None, help='Connect and read timeout in seconds')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Max number of tests in one request, 0 - no limit')
+    parser.add_argument('--chunk-bytes', type=int, default=DEFAULT_CHUNK_BYTES,
+                        help='Max serialized size in bytes of tests in one request, 0 - no limit')
+    parser.add_argument('--workers', type=int, default=4, help='Max number of concurrent chunk uploads')
+    parser.add_argument('--concurrency', type=int, default=0,
+                        help='Max number of requests in flight of all workers, 0 - no limit')
+    parser.add_argument('--retry-attempts', type=int, default=DEFAULT_RETRY_ATTEMPTS,
+                        help='Max number of attempts of one request')
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help='Max number of requests per second shared with other processes of the host, 0 - no limit')
+    parser.add_argument('--rate-burst', type=int, default=DEFAULT_RATE_BURST,
+                        help='Number of requests which may be sent at once before rate limit applies')
+    parser.add_argument('--output', help='Write merged results into result file instead of upload')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        test_execution = merge_result_files(args.files, args.execution_id, args.testplan)
+    except (OSError, ValueError) as e:
+        print('[pytest-xray-merge] {}'.format(e))
+        return 2
+    print('[pytest-xray-merge] Merged {} results of {} files'.format(len(test_execution.tests), len(args.files)))
+    if args.output:
+        write_result_file(args.output, test_execution)
+        return 0
+    settings = dict(url=args.url,
+                    username=args.username,
+                    verify=args.verify,
+                    timeout=args.timeout,
+                    retry=dict(max_attempts=args.retry_attempts,
+                               backoff_base=DEFAULT_RETRY_BACKOFF,
+                               total_timeout=DEFAULT_RETRY_BUDGET),
+                    concurrency=args.concurrency,
+                    pool_size=max(args.workers, args.concurrency),
+                    rate_limit=dict(rate=args.rate_limit, burst=args.rate_burst))
+    publisher = build_publisher(settings, password=os.environ.get(PASSWORD_ENV))
+    try:
+        key = publisher.publish_chunked(test_execution,
+                                        max_tests=args.chunk_size,
+                                        max_bytes=args.chunk_bytes,
+                                        workers=args.workers)
+    finally:
+        publisher.close()
+    if publisher.errors or not key:
+        print('[pytest-xray-merge] Upload failed: {}'.format('\n'.join(publisher.errors)))
+        return 1
+    print('[pytest-xray-merge] Uploaded to test execution {} by {} requests'.format(key, len(publisher.attempts)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+PROMETHEUS_PREFIX = 'pytest_xray'
+
+
+class _Timer:
+    __slots__ = ('_metrics', '_name', '_started')
+
+    def __init__(self, metrics: 'Metrics', name: str) -> None:
+        self._metrics = metrics
+        self._name = name
+        self._started = 0.0
+
+    def __enter__(self) -> None:
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self._metrics.add_time(self._name, time.perf_counter() - self._started)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Timers and counters of plugin hot paths. Disabled instance costs one attribute check per call,
+    so it is always passed around instead of None. Thread-safe: background uploader and chunk upload
+    workers report into the same instance
+        with metrics.timer('serialize'):
+            body = dumps(data)
+        metrics.incr('bytes_sent', len(body))
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # name -> [calls, total seconds, max seconds]
+        self._timers: Dict[str, List[float]] = {}
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+
+    def timer(self, name: str):
+        """
+        Context manager which adds time of the block to timer `name`
+        """
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def add_time(self, name: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                self._timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+
+    def incr(self, name: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe_max(self, name: str, value: float) -> None:
+        """
+        Keep the highest observed value (e.g. queue depth)
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if value > self._gauges.get(name, float('-inf')):
+                self._gauges[name] = value
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return dict(timers={name: dict(calls=calls, total_s=total, avg_s=total / calls, max_s=maximum)
+                                for name, (calls, total, maximum) in sorted(self._timers.items())},
+                        counters=dict(sorted(self._counters.items())),
+                        gauges=dict(sorted(self._gauges.items())))
+
+    def summary(self) -> List[str]:
+        """
+        Method to format timing breakdown for terminal
+
+        Returns:
+            list, lines of breakdown
+        """
+        data = self.as_dict()
+        lines = ["{}: {} calls, total {:.3f}s, avg {:.3f}ms, max {:.3f}ms".format(
+            name, timer['calls'], timer['total_s'], timer['avg_s'] * 1000, timer['max_s'] * 1000)
+            for name, timer in data['timers'].items()]
+        lines += ["{}: {:g}".format(name, value) for name, value in data['counters'].items()]
+        lines += ["{} (max): {:g}".format(name, value) for name, value in data['gauges'].items()]
+        return lines
+
+    def to_prometheus(self) -> str:
+        """
+        Method to format metrics for node_exporter textfile collector
+
+        Returns:
+            str, metrics in Prometheus text exposition format
+        """
+        data = self.as_dict()
+        lines = []
+        for metric, field, metric_type in (('seconds_total', 'total_s', 'counter'),
+                                           ('calls_total', 'calls', 'counter'),
+                                           ('seconds_max', 'max_s', 'gauge')):
+            lines.append('# TYPE {}_{} {}'.format(PROMETHEUS_PREFIX, metric, metric_type))
+            lines += ['{}_{}{{phase="{}"}} {}'.format(PROMETHEUS_PREFIX, metric, name, timer[field])
+                      for name, timer in data['timers'].items()]
+        for name, value in data['counters'].items():
+            lines.append('# TYPE {}_{}_total counter'.format(PROMETHEUS_PREFIX, name))
+            lines.append('{}_{}_total {}'.format(PROMETHEUS_PREFIX, name, value))
+        for name, value in data['gauges'].items():
+            lines.append('# TYPE {}_{}_max gauge'.format(PROMETHEUS_PREFIX, name))
+            lines.append('{}_{}_max {}'.format(PROMETHEUS_PREFIX, name, value))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: str) -> None:
+        """
+        Method to write metrics into file: Prometheus textfile for *.prom, JSON otherwise.
+        File is replaced atomically, so collectors never read partial file
+        Args:
+            path: str, path to file
+        """
+        if path.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.as_dict(), indent=2)
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(content)
+        os.replace(temp_path, path)
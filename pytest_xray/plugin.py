@@ -1,4 +1,6 @@
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from os import environ
 from typing import List, Dict, Any, Union
 
@@ -12,30 +14,94 @@ from _pytest.terminal import TerminalReporter
 from _pytest.reports import TestReport
 
 from .constant import (
-    XRAY_MARKER_NAME,
+    DEFAULT_COMMENT_HEAD,
+    DEFAULT_COMMENT_TAIL,
+    REPLAY,
 )
 from .helper import (
+    STATUS_SEVERITY,
     Status,
     TestCase,
     TestExecution,
+    TestResult,
     datatypes_converter,
+    merge_worst,
 )
+from .longrepr import BOUNDED, capture_comment, error_signature
+from .markers import MarkerCache, MarkerIndex
+from .merge import write_result_file
+from .metrics import Metrics
+from .sidecar import hand_over
+from .spool import ResultSpool, SpooledPublisher
+from .state import DeltaPublisher, ResultState
+from .uploader import BackgroundUploader, ExecutionBatcher, PriorityBatcher
 from .xray_publisher import XrayPublisher
 
 
 class JiraXrayPlugin:
 
     def __init__(self, api_client, **kwargs):
-        self.__testcase_jiraid_map = {}
-        self._pytest_report = []
+        # nodeid -> Jira keys and Jira key -> nodeids
+        self.__marker_index = MarkerIndex()
+        # (nodeid, Jira key) -> report, the latest report of a case wins (xdist worker crash, reruns)
+        self._pytest_report = {}
+        # Jira key -> severity of the worst status pushed in interactive mode
+        self.__pushed_severity = {}
         self.__client: XrayPublisher = api_client
-        self.__xr_execution_id = ""
-        self.__xr_testplan_id = ""
+        self.__xr_execution_id = kwargs.get("execution_id") or ""
+        self.__xr_testplan_id = kwargs.get("testplan_id") or ""
+        self.__precreate_execution = kwargs.get("precreate_execution", False)
+        self.__execution_future = None
         self.__interactive_mode = kwargs.get("interactive_push", False)
         self.__all_fails_allowed = kwargs.get("all_fails_allowed", False)
         self.__pytest_fields_to_push = kwargs.get("pytest_fields_to_push") or {}
         self.__osenv_fields_to_push = kwargs.get("osenv_fields_to_push") or {}
+        self.__background_push = kwargs.get("background_push", False)
+        self.__queue_size = kwargs.get("queue_size", 0)
+        self.__drain_timeout = kwargs.get("drain_timeout")
+        # batch interval is configured in ms
+        self.__batcher = ExecutionBatcher(max_size=kwargs.get("batch_size", 1),
+                                          max_delay=(kwargs.get("batch_interval") or 0) / 1000)
+        if kwargs.get("priority_lanes", False):
+            # failures keep batch caps, other results wait for bulk caps (by default for the end of session)
+            bulk_interval = kwargs.get("bulk_batch_interval")
+            self.__batcher = PriorityBatcher(
+                urgent=self.__batcher,
+                bulk=ExecutionBatcher(max_size=kwargs.get("bulk_batch_size") or sys.maxsize,
+                                      max_delay=bulk_interval / 1000 if bulk_interval else None))
+        if self.__interactive_mode and (kwargs.get("priority_lanes", False) or (kwargs.get("batch_size") or 1) > 1):
+            # time cap of batch is checked by uploader thread, in foreground batch would wait for the next result
+            self.__background_push = True
+        self.__uploader = None
+        self.__chunk_options = kwargs.get("chunk_options") or {}
+        self.__result_file = kwargs.get("result_file")
+        self.__result_file_written = False
+        # directory, publisher settings and password of detached uploader
+        self.__sidecar = kwargs.get("sidecar")
+        self.__spool_path = kwargs.get("spool")
+        self.__spool = None
+        self.__spool_start = 0
+        self.__spooled_count = 0
+        self.__spooled_passed = False
+        # xdist worker only marks reports with Jira keys, controller aggregates and uploads them
+        self.__xdist_worker = kwargs.get("xdist_worker", False)
+        self.__config = None
         self.__static_data = {}
+        self.__metrics: Metrics = kwargs.get("metrics") or Metrics(enabled=False)
+        self.__timing_summary = kwargs.get("timing_summary", False)
+        self.__metrics_file = kwargs.get("metrics_file")
+        self.__delta_upload = kwargs.get("delta_upload", False)
+        self.__force_sync = kwargs.get("force_sync", False)
+        self.__delta = None
+        self.__comment_mode = kwargs.get("comment_mode", BOUNDED)
+        self.__comment_head = kwargs.get("comment_head", DEFAULT_COMMENT_HEAD)
+        self.__comment_tail = kwargs.get("comment_tail", DEFAULT_COMMENT_TAIL)
+        self.__dedup_failures = kwargs.get("dedup_failures", False)
+        # error signature -> (nodeid, Jira key) of the first failure with the signature
+        self.__failure_signatures = {}
+        self.__deduplicated = 0
+        self.__collection_cache = kwargs.get("collection_cache", False)
+        self.__cache_clear = kwargs.get("cache_clear", False)
         self.__log = logging.getLogger("JiraXrayPlugin")
 
     def __get_cli_and_ini_data(self, pytest_config):
@@ -102,31 +168,35 @@ class JiraXrayPlugin:
             dict
         """
         if not self.__static_data:
-            data = {}
-            cli_parameters = self.__get_cli_and_ini_data(pytest_config)
-            env_parameters = self.__get_env_data()
-            settings_parameters = self.__get_setting_data(pytest_config)
-            data.update(cli_parameters)
-            data.update(env_parameters)
-            data.update(settings_parameters)
+            with self.__metrics.timer('static_data'):
+                data = {}
+                cli_parameters = self.__get_cli_and_ini_data(pytest_config)
+                env_parameters = self.__get_env_data()
+                settings_parameters = self.__get_setting_data(pytest_config)
+                data.update(cli_parameters)
+                data.update(env_parameters)
+                data.update(settings_parameters)
+                # static data is identical for every result, so it is converted once
+                data = datatypes_converter(data)
             self.__static_data = data
         else:
             data = self.__static_data
         return data
 
-    def _get_pytest_report(self, pytest_report: TestReport, pytest_config, **kwargs):
+    def _get_pytest_report(self, pytest_report: TestReport, pytest_config, **kwargs) -> TestResult:
         """
-        Method to convert pytest report to a dictionary
+        Method to convert pytest report to a compact result record
         Args:
             pytest_report: TestReport, report
             pytest_config: pytest config object
             **kwargs:
+                convert_datatypes: bool, convert values of debug payload
 
         Returns:
-
+            TestResult, record of the first Jira key of report which refers to shared static data
+            instead of copying it
         """
-        py_execution_report = {}
-        convert_datatypes = kwargs.get('convert_datatypes', True)
+        test_key = pytest_report.xray_test_keys[0]
         static_data = self.__get_static_data(pytest_config)
         splt_test_name = pytest_report.nodeid.split('::')
         if len(splt_test_name) == 2:
@@ -135,11 +205,6 @@ class JiraXrayPlugin:
             tc_module, tc_name = pytest_report.nodeid.split('::')[1:3]
         else:
             tc_module, tc_name = pytest_report.nodeid, pytest_report.nodeid
-        if len(pytest_report.longreprtext) > 5000:
-            longreprtext = pytest_report.longreprtext[:2000] + " TRUNCATED " + pytest_report.longreprtext[-3000:]
-        else:
-            longreprtext = pytest_report.longreprtext
-
         if pytest_report.passed:
             status = "passed"
         elif pytest_report.failed:
@@ -148,63 +213,267 @@ class JiraXrayPlugin:
             status = "skipped"
         else:
             status = "None"
+        signature = None
         if pytest_report.user_properties:
-            error_signature = pytest_report.user_properties.get("error_signature")
-            py_execution_report.update(error_signature=error_signature)
-        py_execution_report.update(status=status,
-                                   longreprtext=longreprtext,
-                                   execution_time=pytest_report.duration,
-                                   tc_name=tc_name,
-                                   jira_id=self.__testcase_jiraid_map[pytest_report.nodeid],
-                                   )
-
-        py_execution_report.update(static_data)
-
-        if convert_datatypes:
-            py_execution_report = datatypes_converter(py_execution_report)
-        self.__log.debug("Generated payload: {}".format(py_execution_report))
-        return py_execution_report
-
-    def _generate_xray_execution_report(self, report: Union[dict, list]):
+            # user_properties is a list of (name, value) tuples
+            signature = dict(pytest_report.user_properties).get("error_signature")
+        if signature is None and self.__dedup_failures and status == "failed":
+            signature = error_signature(pytest_report)
+        first_failure = None
+        if signature is not None and self.__dedup_failures:
+            first_failure = self.__failure_signatures.setdefault(signature,
+                                                                 (pytest_report.nodeid, test_key))
+        if first_failure and first_failure[0] != pytest_report.nodeid:
+            # traceback of identical failure is pushed once, the others refer to it
+            longreprtext = "Same failure as {} ({}), signature: {}".format(first_failure[1], first_failure[0], signature)
+            self.__deduplicated += 1
+        else:
+            # only head and tail budget of traceback is kept, whole `longreprtext` is never built
+            longreprtext = capture_comment(pytest_report, self.__comment_mode, self.__comment_head,
+                                           self.__comment_tail)
+        result = TestResult(nodeid=pytest_report.nodeid,
+                            test_key=test_key,
+                            status=status,
+                            comment=longreprtext,
+                            duration=pytest_report.duration,
+                            tc_name=tc_name,
+                            error_signature=signature,
+                            static_data=static_data)
+        if self.__log.isEnabledFor(logging.DEBUG):
+            self.__log.debug("Generated payload: {}".format(
+                result.as_dict(convert_datatypes=kwargs.get('convert_datatypes', True))))
+        return result
+
+    def _generate_xray_execution_report(self, report: Union[TestResult, list]):
         """
         Method to convert pytest report to xray test execution
         Args:
-            report: dict/list, representation of pytest report
+            report: TestResult/list, result records of pytest report
 
         Returns:
-            TestExecution: generated object will all executions
+            TestExecution: generated object will all executions, results of one Jira key are merged
+            into the worst one
         """
         # self.__xr_execution_id - dynamically updates after interactive mode push
         xray_test_execution = TestExecution(test_execution_key=self.__xr_execution_id,
                                             test_plan_key=self.__xr_testplan_id)
-        if isinstance(report, dict):
+        if isinstance(report, TestResult):
             report = [report]
 
         for test in report:
-            status = test["status"]
-            jira_id = test["jira_id"]
-            longreprtext = test.get("longreprtext")
-            if 'passed' in status:
+            status = test.status
+            jira_id = test.test_key
+            longreprtext = test.comment
+            if status == 'passed':
                 tc = TestCase(jira_id, Status.PASS)
-            elif 'failed' in status:
+            elif status == 'failed':
                 tc = TestCase(jira_id, Status.FAIL, longreprtext)
-            elif 'skipped' in status:
+            elif status == 'skipped':
                 tc = TestCase(jira_id, Status.ABORTED, longreprtext)
             else:
-                raise ValueError("Unsupported execution status: '{}'".format(test["status"]))
+                raise ValueError("Unsupported execution status: '{}'".format(test.status))
             xray_test_execution.append(tc)
+        xray_test_execution.tests = merge_worst(xray_test_execution.tests)
         return xray_test_execution
 
+    def _aggregate_reports(self) -> List[TestResult]:
+        """
+        Method to get kept results grouped by Jira key in order of collection
+
+        Returns:
+            list of TestResult
+        """
+        index = self.__marker_index
+        return [self._pytest_report[nodeid, key]
+                for key in index.test_keys()
+                for nodeid in index.nodeids_of(key)
+                if (nodeid, key) in self._pytest_report]
+
+    def _is_worse_than_pushed(self, test: TestCase) -> bool:
+        """
+        Method to check if interactive result changes the worst status pushed for its Jira key,
+        so passed run of parametrized test never overwrites failed one
+        Args:
+            test: TestCase, result
+
+        Returns:
+            bool
+        """
+        severity = STATUS_SEVERITY[test.status]
+        if severity > self.__pushed_severity.get(test.test_key, -1):
+            self.__pushed_severity[test.test_key] = severity
+            return True
+        return False
+
     def _push_report(self, report: TestExecution):
         """
-        Method to push report to Jira
+        Method to push report to Jira. Big reports are split into chunks
         Args:
             report: TestExecution, object with case execution details
 
         Returns:
             str, ID of test execution
         """
-        return self.__client.publish(report)
+        return self.__client.publish_chunked(report, **self.__chunk_options)
+
+    def _resolve_execution(self):
+        """
+        Method to wait for test execution which is created on the start of test run
+
+        Returns:
+            str, key of test execution, empty if it is created by the first push
+        """
+        if self.__execution_future is None:
+            return self.__xr_execution_id
+        future, self.__execution_future = self.__execution_future, None
+        try:
+            key = future.result()
+        except Exception:
+            self.__log.exception("Test execution was not created on the start of test run")
+            key = ""
+        if key:
+            self.__xr_execution_id = key
+            if self.__uploader and not self.__uploader.execution_key:
+                # nothing is submitted to uploader yet, so the key is set before any push
+                self.__uploader.execution_key = key
+        else:
+            self.__log.warning("Test execution was not created on the start of test run, the first push creates it")
+        return self.__xr_execution_id
+
+    def _push_final(self, report: TestExecution):
+        """
+        Method to push report on the end of test run, by detached sidecar process if it is enabled.
+        Report of shard is written into result file instead
+        Args:
+            report: TestExecution, object with case execution details
+        """
+        if self.__result_file:
+            try:
+                write_result_file(self.__result_file, report, append=self.__result_file_written)
+            except OSError as e:
+                self.__client.errors.append("Results were not written to {}: {}".format(self.__result_file, e))
+                return
+            self.__result_file_written = True
+            print("\n[JiraXrayPlugin] {} results are written to {}".format(len(report.tests), self.__result_file))
+            return
+        if not self.__sidecar or not report.tests:
+            return self._push_report(report)
+        try:
+            job = hand_over(self.__sidecar["directory"], self.__sidecar["settings"], self.__sidecar["password"],
+                            report, chunk_options=self.__chunk_options, spool=self.__spool_path,
+                            spool_run=self.__spool.run if self.__spool else None)
+        except (OSError, ValueError) as e:
+            self.__log.error("Sidecar uploader was not started: {}. Results are pushed by pytest".format(e))
+            return self._push_report(report)
+        print("\n[JiraXrayPlugin] Upload of {} results is handed to sidecar process {}, log: {}".format(
+            len(report.tests), job["pid"], job["log"]))
+        print("[JiraXrayPlugin] To check uploads run: python -m pytest_xray.sidecar status --dir {}".format(
+            self.__sidecar["directory"]))
+
+    def _push_batch(self, batch: TestExecution):
+        """
+        Method to push batch of interactive results in foreground
+        Args:
+            batch: TestExecution, merged executions or None if batch is not ready yet
+        """
+        if batch is not None:
+            exec_id = self._push_report(batch)
+            # this is needed to update execId for _generate_xray_execution_report() function
+            self.__xr_execution_id = exec_id or self.__xr_execution_id
+
+    def _push_deferred(self):
+        """
+        Method to push results deferred while circuit breaker was open (Jira was unavailable)
+        """
+        deferred = self.__client.deferred
+        if not deferred:
+            return
+        xray_execution = TestExecution(test_execution_key=self.__xr_execution_id,
+                                       test_plan_key=self.__xr_testplan_id)
+        for test_execution in deferred:
+            xray_execution.merge(test_execution)
+        del deferred[:]
+        self._push_final(xray_execution)
+        not_uploaded = sum(len(test_execution.tests) for test_execution in deferred)
+        if not_uploaded:
+            print("\n[JiraXrayPlugin] Jira is unavailable. Not uploaded results: {}".format(not_uploaded))
+            self.__client.errors.append("Circuit breaker is open, {} results were not uploaded".format(not_uploaded))
+
+    def _process_report(self, report: TestReport, pytest_config):
+        """
+        Method to store report of xray-marked case and push it in interactive mode
+        Args:
+            report: TestReport, report
+            pytest_config: pytest config object
+        """
+        test_keys = report.xray_test_keys
+        # xdist controller doesn't collect items, index is filled from reports of workers
+        self.__marker_index.add(report.nodeid, test_keys)
+        with self.__metrics.timer('report_conversion'):
+            pytest_report = self._get_pytest_report(report, pytest_config)
+        results = [pytest_report] + [pytest_report.with_key(test_key) for test_key in test_keys[1:]]
+        if self.__interactive_mode:
+            # execution is built with key of pre-created test execution, so the first push doesn't create another one
+            self._resolve_execution()
+        if self.__spool:
+            # results are kept on disk only, so memory stays flat
+            with self.__metrics.timer('execution_report'):
+                xray_execution = self._generate_xray_execution_report(results)
+            for test in xray_execution.tests:
+                test.seqs = (self.__spool.append(report.nodeid, test),)
+            self.__spooled_count += 1
+            self.__spooled_passed |= pytest_report.status == "passed"
+        else:
+            for result in results:
+                self._pytest_report[report.nodeid, result.test_key] = result
+        if self.__interactive_mode:
+            if not self.__spool:
+                with self.__metrics.timer('execution_report'):
+                    xray_execution = self._generate_xray_execution_report(results)
+            tests = [test for test in xray_execution.tests if self._is_worse_than_pushed(test)]
+            if self.__spool and len(tests) < len(xray_execution.tests):
+                # replay must not push filtered result over the worse one
+                self.__spool.mark_superseded([seq for test in xray_execution.tests if test not in tests
+                                              for seq in test.seqs])
+            xray_execution.tests = tests
+            if not xray_execution.tests:
+                return
+            if self.__uploader:
+                # execution key is threaded by uploader worker
+                self.__uploader.submit(xray_execution)
+            else:
+                # time cap is checked on arrival of each result in foreground mode
+                self._push_batch(self.__batcher.add(xray_execution))
+
+    def _print_attempts(self):
+        """
+        Method to print statistics of requests to Jira and every failed attempt
+        """
+        attempts = self.__client.attempts
+        if not attempts:
+            return
+        latencies = [attempt.latency for attempt in attempts]
+        failed = [attempt for attempt in attempts if not attempt.ok]
+        print("\n[JiraXrayPlugin] Requests: {}, failed attempts: {}, latency avg/max: {:.3f}s/{:.3f}s".format(
+            len(attempts), len(failed), sum(latencies) / len(latencies), max(latencies)))
+        for attempt in failed:
+            next_step = "retry in {:.2f}s".format(attempt.delay) if attempt.delay is not None else "gave up"
+            print("[JiraXrayPlugin]   attempt {}: {} in {:.3f}s, {}".format(
+                attempt.number, attempt.outcome, attempt.latency, next_step))
+
+    def _report_metrics(self):
+        """
+        Method to print timing breakdown and export metrics of the plugin
+        """
+        if self.__timing_summary:
+            print("\n[JiraXrayPlugin] Timing breakdown:")
+            for line in self.__metrics.summary():
+                print("[JiraXrayPlugin]   {}".format(line))
+        if self.__metrics_file:
+            try:
+                self.__metrics.export(self.__metrics_file)
+            except OSError as e:
+                self.__log.error("Couldn't write metrics to {}: {}".format(self.__metrics_file, e))
 
     # pytest hooks part
     # =============================================================
@@ -217,17 +486,24 @@ class JiraXrayPlugin:
         """
         pytest hook for collecting cases. On the step we extract Xray markers
         """
-        for item in items:
-            # associate test cases with JiraID from Xray markers
-            marker = item.get_closest_marker(XRAY_MARKER_NAME)
-            if marker:
-                test_key = marker.args[0]
-                self.__testcase_jiraid_map[item.nodeid] = test_key
-
-    @pytest.mark.hookwrapper
+        marker_cache = None
+        if (self.__collection_cache or self.__cache_clear) and hasattr(config, 'cache'):
+            marker_cache = MarkerCache(config.cache)
+            if self.__cache_clear:
+                marker_cache.clear()
+        # associate test cases with Jira keys from Xray markers of function, class and module
+        with self.__metrics.timer('marker_index'):
+            self.__marker_index.build(items, marker_cache if self.__collection_cache else None)
+        # all xdist workers collect the same items, the first one keeps cache
+        workerinput = getattr(config, 'workerinput', None)
+        if marker_cache and (workerinput is None or workerinput.get('workerid') == 'gw0'):
+            marker_cache.save()
+
+    @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_makereport(self, item, call):
         """
-        Generate report after each tc execution
+        Mark report of xray case with Jira keys. The attribute is serialized together with report,
+        so xdist controller gets it from workers
         Args:
             item: : pytest item object
             call: : pytest call object
@@ -237,25 +513,26 @@ class JiraXrayPlugin:
         """
         outcome = yield
         report = outcome.get_result()
+        test_keys = self.__marker_index.keys_of(report.nodeid)
+        if test_keys:
+            report.xray_test_keys = list(test_keys)
 
+    def pytest_runtest_logreport(self, report: TestReport) -> None:
+        """
+        Generate report after each tc execution. Called in the main process for local run
+        and on xdist controller for reports of all workers
+        Args:
+            report: TestReport, report
+        """
+        if self.__xdist_worker:
+            return
+        test_keys = getattr(report, 'xray_test_keys', None)
         if report.when == 'setup' and (report.skipped or report.failed):
-            if report.nodeid in self.__testcase_jiraid_map:
-                pytest_report = self._get_pytest_report(report, item.config)
-                self._pytest_report.append(pytest_report)
-                if self.__interactive_mode:
-                    xray_execution = self._generate_xray_execution_report(pytest_report)
-                    exec_id = self._push_report(xray_execution)
-                    # this is needed to update execId for _generate_xray_execution_report() function
-                    self.__xr_execution_id = exec_id
+            if test_keys:
+                self._process_report(report, self.__config)
         elif report.when == 'call':
-            if report.nodeid in self.__testcase_jiraid_map:
-                pytest_report = self._get_pytest_report(report, item.config)
-                self._pytest_report.append(pytest_report)
-                if self.__interactive_mode:
-                    xray_execution = self._generate_xray_execution_report(pytest_report)
-                    exec_id = self._push_report(xray_execution)
-                    # this is needed to update execId for _generate_xray_execution_report() function
-                    self.__xr_execution_id = exec_id
+            if test_keys:
+                self._process_report(report, self.__config)
             else:
                 self.__log.info("{} doesnt contain Xray marker".format(report.nodeid))
 
@@ -266,18 +543,91 @@ class JiraXrayPlugin:
     #     """
     #     pass
 
+    def pytest_sessionstart(self, session):
+        """
+        pytest hook on the start of test run. Starts background uploader for interactive mode
+        and creation of test execution if it is pre-created
+        """
+        self.__config = session.config
+        if self.__xdist_worker:
+            return
+        if self.__spool_path:
+            self.__spool = ResultSpool(self.__spool_path)
+            # results of previous runs are uploaded by --xr-replay only
+            self.__spool_start = self.__spool.last_seq
+            self.__spool.start_run(self.__xr_testplan_id)
+            self.__client = SpooledPublisher(self.__client, self.__spool)
+        if self.__delta_upload:
+            if hasattr(session.config, 'cache'):
+                # state of pushed results is kept in .pytest_cache between runs
+                self.__delta = DeltaPublisher(self.__client, ResultState(session.config.cache), force=self.__force_sync)
+                self.__client = self.__delta
+            else:
+                self.__log.warning("Delta upload requires pytest cacheprovider plugin, all results are pushed")
+        if self.__precreate_execution and not self.__xr_execution_id:
+            # test execution is created while tests are running, so pushes of results don't wait for each other
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='xray-execution')
+            self.__execution_future = executor.submit(self.__client.publish,
+                                                      TestExecution(test_plan_key=self.__xr_testplan_id))
+            executor.shutdown(wait=False)
+        if self.__interactive_mode and self.__background_push:
+            self.__uploader = BackgroundUploader(self.__client,
+                                                 execution_key=self.__xr_execution_id,
+                                                 queue_size=self.__queue_size,
+                                                 batcher=self.__batcher,
+                                                 metrics=self.__metrics,
+                                                 workers=self.__chunk_options.get("workers", 1)
+                                                 if self.__precreate_execution else 1,
+                                                 chunk_options=self.__chunk_options)
+            self.__uploader.start()
+
     def pytest_sessionfinish(self, session, exitstatus):
         """
         pytest hook on the end of test run. In the place we push all report in non-interactive mode
         """
-        is_passed = any(case.get('status') == "passed" for case in self._pytest_report)
+        if self.__xdist_worker:
+            return
+        self._resolve_execution()
+        if self.__uploader:
+            not_uploaded = self.__uploader.stop(timeout=self.__drain_timeout)
+            self.__xr_execution_id = self.__uploader.execution_key
+            if not_uploaded:
+                print("\n[JiraXrayPlugin] Upload queue wasn't drained in {}s. Not uploaded results: {}".format(
+                    self.__drain_timeout, not_uploaded))
+        elif self.__interactive_mode:
+            self._push_batch(self.__batcher.flush())
+        if self.__spool:
+            is_passed = self.__spooled_passed
+            total_items = self.__spooled_count
+        else:
+            is_passed = any(case.status == "passed" for case in self._pytest_report.values())
+            total_items = len(self._pytest_report)
         if not self.__interactive_mode:
             if is_passed or (self.__all_fails_allowed is not is_passed):
-                xray_execution = self._generate_xray_execution_report(self._pytest_report)
-                self._push_report(xray_execution)
+                if self.__spool:
+                    xray_execution = TestExecution(test_execution_key=self.__xr_execution_id,
+                                                   test_plan_key=self.__xr_testplan_id,
+                                                   tests=merge_worst(self.__spool.pending(after_seq=self.__spool_start)))
+                else:
+                    with self.__metrics.timer('execution_report'):
+                        xray_execution = self._generate_xray_execution_report(self._aggregate_reports())
+                with self.__metrics.timer('upload'):
+                    self._push_final(xray_execution)
             else:
                 print("\n[JiraXrayPlugin] There are no passed cases. By config zero-pass runs prohibited to push")
-        print("\n[JiraXrayPlugin] Report sync finished. Total items: '{}'".format(len(self._pytest_report)))
+        self._push_deferred()
+        print("\n[JiraXrayPlugin] Report sync finished. Total items: '{}'".format(total_items))
+        if self.__deduplicated:
+            print("[JiraXrayPlugin] Failures referring to identical failure: {}, distinct failures: {}".format(
+                self.__deduplicated, len(self.__failure_signatures)))
+        if self.__delta and self.__delta.skipped:
+            print("[JiraXrayPlugin] Unchanged results were not pushed: {}".format(self.__delta.skipped))
+        self._print_attempts()
+        self._report_metrics()
         if self.__client.errors:
             print("\n[JiraXrayPlugin] Report sync failed: {} times".format(len(self.__client.errors)))
             print("\n[JiraXrayPlugin] Errors: {}".format("\n".join(self.__client.errors)))
+            if self.__spool:
+                print("\n[JiraXrayPlugin] Not uploaded results are kept in spool, to upload them run: "
+                      "pytest --{} {}".format(REPLAY, self.__spool_path))
+        self.__client.close()
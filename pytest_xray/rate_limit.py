@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .constant import DEFAULT_RATE_BURST
+
+_log = logging.getLogger(__name__)
+
+
+def default_state_file(base_url: str) -> str:
+    """
+    Function to get state file of rate limiter shared by all processes which push to the same Jira
+    Args:
+        base_url: str, Jira url
+
+    Returns:
+        str, path in temporary directory
+    """
+    digest = hashlib.sha1((base_url or '').encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), 'pytest-xray-rate-{}.json'.format(digest))
+
+
+class SharedTokenBucket:
+    """
+    Token bucket shared by processes of the host (xdist workers, parallel CI jobs, tox envs) through state file
+    locked by flock. Each request reserves the next free slot (GCRA), so requests of all processes are spread
+    evenly at `rate` per second after a burst of `burst` requests, instead of all processes hitting 429 together.
+    Without fcntl (Windows) the limit is applied per process
+    """
+
+    def __init__(self, rate: float, burst: int = DEFAULT_RATE_BURST, path: str = None) -> None:
+        if rate <= 0:
+            raise ValueError('Rate limit must be positive: {}'.format(rate))
+        self.rate = rate
+        self.burst = max(int(burst or 1), 1)
+        self.path = path or default_state_file('')
+        self._lock = threading.Lock()
+        # theoretical arrival time of the next request, used when state file can't be locked
+        self._local_tat = 0.0
+        if fcntl is None:
+            _log.warning('Cross-process rate limit requires fcntl, the limit is applied per process')
+
+    def _reserve(self, tat: float, now: float):
+        interval = 1.0 / self.rate
+        tat = max(tat, now)
+        wait = max(tat - (self.burst - 1) * interval - now, 0.0)
+        return wait, tat + interval
+
+    def _reserve_shared(self) -> float:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, 'r+') as state_file:
+            fcntl.flock(state_file.fileno(), fcntl.LOCK_EX)
+            try:
+                # time is taken under the lock, so writers of the state file are ordered by it
+                now = time.time()
+                try:
+                    state = json.loads(state_file.read() or '{}')
+                    tat, updated = float(state.get('tat', 0.0)), float(state.get('updated', 0.0))
+                except (ValueError, AttributeError):
+                    tat, updated = 0.0, 0.0
+                if now < updated:
+                    # wall clock went back since the last reservation, reserved slots are meaningless
+                    tat = now
+                wait, tat = self._reserve(tat, now)
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps(dict(tat=tat, updated=now, rate=self.rate)))
+                state_file.flush()
+            finally:
+                fcntl.flock(state_file.fileno(), fcntl.LOCK_UN)
+        return wait
+
+    def _reserve_local(self) -> float:
+        wait, self._local_tat = self._reserve(self._local_tat, time.monotonic())
+        return wait
+
+    def acquire(self) -> float:
+        """
+        Method to wait for the slot of the next request
+
+        Returns:
+            float, seconds waited
+        """
+        with self._lock:
+            if fcntl is None:
+                wait = self._reserve_local()
+            else:
+                try:
+                    wait = self._reserve_shared()
+                except OSError as e:
+                    _log.warning('State file of rate limiter %s is not available: %s', self.path, e)
+                    wait = self._reserve_local()
+        if wait:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,83 @@
+import gzip
+import json
+import logging
+import zlib
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:  # optional fast backend
+    orjson = None
+
+_log = logging.getLogger(__name__)
+
+AUTO = 'auto'
+COMPRESSIONS = ('gzip', 'deflate')
+
+
+def _json_dumps(data: Any) -> bytes:
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _orjson_dumps(data: Any) -> bytes:
+    # orjson encodes str enums (Status) by value and returns bytes directly
+    return orjson.dumps(data)
+
+
+SERIALIZERS = {
+    'json': _json_dumps,
+    'orjson': _orjson_dumps,
+}
+
+
+def get_serializer(name: str = AUTO) -> Callable[[Any], bytes]:
+    """
+    Function to get serializer of request bodies
+    Args:
+        name: str, 'json', 'orjson' or 'auto' - orjson if it is installed, json otherwise
+
+    Returns:
+        callable, serializes payload straight to UTF-8 bytes
+    """
+    name = (name or AUTO).lower()
+    if name == AUTO:
+        name = 'orjson' if orjson else 'json'
+    if name == 'orjson' and orjson is None:
+        _log.warning('orjson is not installed, json serializer is used')
+        name = 'json'
+    if name not in SERIALIZERS:
+        raise ValueError("Unsupported serializer: '{}'".format(name))
+    return SERIALIZERS[name]
+
+
+def get_compression(name: str = None) -> Optional[str]:
+    """
+    Function to validate compression option
+    Args:
+        name: str, 'gzip', 'deflate', 'none' or empty
+
+    Returns:
+        str, value of Content-Encoding header or None if compression is disabled
+    """
+    if not name or name.lower() == 'none':
+        return None
+    if name.lower() not in COMPRESSIONS:
+        raise ValueError("Unsupported compression: '{}'".format(name))
+    return name.lower()
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Function to compress request body
+    Args:
+        body: bytes, serialized body
+        encoding: str, 'gzip' or 'deflate' (value of Content-Encoding header)
+
+    Returns:
+        bytes
+    """
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    if encoding == 'deflate':
+        return zlib.compress(body, 6)
+    raise ValueError("Unsupported compression: '{}'".format(encoding))
@@ -0,0 +1,308 @@
+"""
+Detached uploader of test results, so pytest process doesn't wait for Jira on the end of test run.
+
+Plugin writes job file (publisher options, test execution) into sidecar directory and starts
+`python -m pytest_xray.sidecar run JOB`. Password is passed through stdin of the process and is never written
+to disk, job and log files are readable by owner only. Uploads are inspected with:
+
+    python -m pytest_xray.sidecar status [--dir .xray_sidecar]
+    python -m pytest_xray.sidecar wait [--dir .xray_sidecar] [--timeout 600]
+    python -m pytest_xray.sidecar clean [--dir .xray_sidecar]
+"""
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import uuid
+from typing import List, Optional
+
+from .constant import DATETIME_FORMAT, DEFAULT_SIDECAR_DIR
+from .helper import TestCase, TestExecution
+
+JOB_SUFFIX = '.job.json'
+LOG_SUFFIX = '.log'
+PID_SUFFIX = '.pid'
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+# process of running job exited without result (killed, out of memory)
+LOST = 'lost'
+UNFINISHED = (PENDING, RUNNING)
+
+_log = logging.getLogger(__name__)
+
+
+def _now() -> str:
+    return dt.datetime.now(tz=dt.timezone.utc).strftime(DATETIME_FORMAT)
+
+
+def _write_json(path: str, data: dict) -> None:
+    # job is replaced atomically, so status readers never see half-written file
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_alive(pid: Optional[int]) -> bool:
+    if not pid or os.name == 'nt':
+        # os.kill() terminates process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def dump_execution(test_execution: TestExecution) -> dict:
+    return dict(test_execution_key=test_execution.test_execution_key,
+                test_plan_key=test_execution.test_plan_key,
+                user=test_execution.user,
+                revision=test_execution.revision,
+                start_date=test_execution.start_date.strftime(DATETIME_FORMAT),
+                tests=[[test.test_key, test.status.value, test.comment, test.duration, list(test.seqs)]
+                       for test in test_execution.tests])
+
+
+def load_execution(data: dict) -> TestExecution:
+    tests = []
+    for test_key, status, comment, duration, seqs in data['tests']:
+        test = TestCase(test_key, status, comment, duration)
+        test.seqs = tuple(seqs)
+        tests.append(test)
+    test_execution = TestExecution(test_execution_key=data.get('test_execution_key'),
+                                   test_plan_key=data.get('test_plan_key'),
+                                   user=data.get('user'),
+                                   revision=data.get('revision'),
+                                   tests=tests)
+    test_execution.start_date = dt.datetime.strptime(data['start_date'], DATETIME_FORMAT)
+    return test_execution
+
+
+def hand_over(directory: str, settings: dict, password: Optional[str], test_execution: TestExecution,
+              chunk_options: dict = None, spool: str = None, spool_run: int = None) -> dict:
+    """
+    Function to write upload job and start detached process which uploads it
+    Args:
+        directory: str, sidecar directory
+        settings: dict, options of publisher, see xray_publisher.build_publisher
+        password: str, password of Jira user, passed through stdin
+        test_execution: TestExecution, results to upload
+        chunk_options: dict, max_tests, max_bytes, workers - see BasePublisher.publish_chunked
+        spool: str, spool file of results, uploaded results are marked in it
+        spool_run: int, run of results in spool
+
+    Returns:
+        dict, job
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    job_id = '{}-{}'.format(dt.datetime.now().strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+    path = os.path.join(directory, job_id + JOB_SUFFIX)
+    job = dict(id=job_id,
+               state=PENDING,
+               created=_now(),
+               pid=None,
+               settings=settings,
+               chunk_options=chunk_options or {},
+               spool=os.path.abspath(spool) if spool else None,
+               spool_run=spool_run,
+               execution=dump_execution(test_execution))
+    _write_json(path, job)
+    log_path = os.path.join(directory, job_id + LOG_SUFFIX)
+    options = {}
+    if os.name == 'nt':
+        options['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        # the process survives end of pytest and Ctrl+C in terminal
+        options['start_new_session'] = True
+    with os.fdopen(os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600), 'a') as log_file:
+        process = subprocess.Popen([sys.executable, '-m', 'pytest_xray.sidecar', 'run', path],
+                                   stdin=subprocess.PIPE, stdout=log_file, stderr=subprocess.STDOUT,
+                                   close_fds=True, **options)
+    process.stdin.write(json.dumps(dict(password=password)).encode('utf-8'))
+    process.stdin.close()
+    # pytest doesn't wait for the process, returncode is set to avoid warning of running subprocess on exit
+    process.returncode = 0
+    # job file belongs to the process from now on, pid lets status detect process which died before start
+    with open(os.path.join(directory, job_id + PID_SUFFIX), 'w') as pid_file:
+        pid_file.write(str(process.pid))
+    job.update(pid=process.pid, path=path, log=log_path)
+    return job
+
+
+def run(path: str, secrets: dict = None) -> int:
+    """
+    Function to upload job, it is run by detached process
+    Args:
+        path: str, job file
+        secrets: dict, password
+
+    Returns:
+        int, exit code: 0 - uploaded, 1 - failed
+    """
+    from .spool import ResultSpool, SpooledPublisher
+    from .xray_publisher import build_publisher
+
+    job = _read_json(path)
+    if job is None:
+        _log.error('Job %s is not readable', path)
+        return 1
+    job.update(state=RUNNING, pid=os.getpid(), started=_now())
+    _write_json(path, job)
+    secrets = secrets or {}
+    test_execution = load_execution(job['execution'])
+    publisher = build_publisher(job['settings'], password=secrets.get('password'))
+    spool = ResultSpool(job['spool']) if job.get('spool') else None
+    if spool:
+        publisher = SpooledPublisher(publisher, spool, job.get('spool_run'))
+    key = ''
+    try:
+        key = publisher.publish_chunked(test_execution, **job['chunk_options'])
+    except Exception as e:
+        _log.exception('Upload of job %s failed', job['id'])
+        publisher.errors.append('{}: {}'.format(type(e).__name__, e))
+    finally:
+        publisher.close()
+    errors = list(publisher.errors)
+    if publisher.deferred:
+        errors.append('Jira is unavailable, {} results were not uploaded'.format(
+            sum(len(execution.tests) for execution in publisher.deferred)))
+    job.update(state=FAILED if errors or not key else DONE,
+               finished=_now(),
+               execution_key=key,
+               results=len(test_execution.tests),
+               requests=len(publisher.attempts),
+               errors=errors)
+    # uploaded results are not needed anymore, job keeps the outcome only
+    del job['execution']
+    _write_json(path, job)
+    _log.info('Job %s %s: test execution %s, results %s, errors %s',
+              job['id'], job['state'], key, job['results'], len(errors))
+    return 0 if job['state'] == DONE else 1
+
+
+def jobs(directory: str = DEFAULT_SIDECAR_DIR) -> List[dict]:
+    """
+    Function to get jobs of sidecar directory, running jobs whose process is gone are reported as lost
+    Args:
+        directory: str, sidecar directory
+
+    Returns:
+        list of jobs in order of creation
+    """
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(JOB_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        job = _read_json(path)
+        if job is None:
+            continue
+        base_path = path[:-len(JOB_SUFFIX)]
+        job['path'] = path
+        job['log'] = base_path + LOG_SUFFIX
+        if job['state'] == PENDING and not job.get('pid'):
+            try:
+                with open(base_path + PID_SUFFIX) as pid_file:
+                    job['pid'] = int(pid_file.read())
+            except (OSError, ValueError):
+                pass
+        if job['state'] in UNFINISHED and job.get('pid') and not _is_alive(job['pid']):
+            job['state'] = LOST
+        found.append(job)
+    return found
+
+
+def wait(directory: str = DEFAULT_SIDECAR_DIR, timeout: float = None, interval: float = 0.2) -> List[dict]:
+    """
+    Function to wait for unfinished jobs
+    Args:
+        directory: str, sidecar directory
+        timeout: float, seconds, None - wait until all jobs are finished
+        interval: float, seconds between checks
+
+    Returns:
+        list of all jobs, unfinished ones are still pending or running after timeout
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        found = jobs(directory)
+        if not any(job['state'] in UNFINISHED for job in found):
+            return found
+        if deadline is not None and time.monotonic() >= deadline:
+            return found
+        time.sleep(interval)
+
+
+def _print_jobs(found: List[dict]) -> None:
+    if not found:
+        print('No sidecar uploads')
+    for job in found:
+        details = ''
+        if job['state'] in (DONE, FAILED):
+            details = ' test execution: {}, results: {}, requests: {}'.format(
+                job.get('execution_key') or '-', job.get('results'), job.get('requests'))
+        print('{} {:8}{}'.format(job['id'], job['state'], details))
+        for error in job.get('errors') or []:
+            print('    {}'.format(error))
+        if job['state'] in (FAILED, LOST):
+            print('    log: {}'.format(job['log']))
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m pytest_xray.sidecar',
+                                     description='Detached uploads of pytest-xray-sync')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('run', help='Upload job (started by the plugin)')
+    command.add_argument('job')
+    for name, description in (('status', 'Print state of uploads'),
+                              ('wait', 'Wait for unfinished uploads, exit code 1 if any upload failed'),
+                              ('clean', 'Remove finished uploads')):
+        command = commands.add_parser(name, help=description)
+        command.add_argument('--dir', default=DEFAULT_SIDECAR_DIR, help='Sidecar directory')
+        if name == 'wait':
+            command.add_argument('--timeout', type=float, default=None, help='Seconds to wait')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+        data = sys.stdin.read() if not sys.stdin.isatty() else ''
+        return run(args.job, json.loads(data) if data else {})
+    if args.command == 'status':
+        _print_jobs(jobs(args.dir))
+        return 0
+    if args.command == 'wait':
+        found = wait(args.dir, args.timeout)
+        _print_jobs(found)
+        return 0 if all(job['state'] == DONE for job in found) else 1
+    if args.command == 'clean':
+        for job in jobs(args.dir):
+            if job['state'] not in UNFINISHED:
+                for path in (job['path'], job['log'], job['path'][:-len(JOB_SUFFIX)] + PID_SUFFIX):
+                    if os.path.exists(path):
+                        os.remove(path)
+        return 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
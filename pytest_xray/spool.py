@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .helper import TestCase, TestExecution, merge_worst
+from .xray_publisher import BasePublisher, PublisherWrapper
+
+
+class ResultSpool:
+    """
+    Append-only JSON Lines file with test results and upload markers. Four kinds of lines are written:
+        {"run": 1, "test_plan": "JIRA-50"}
+        {"seq": 1, "run": 1, "nodeid": "test_a.py::test_one", "test_key": "JIRA-1", "status": "PASS", "comment": ""}
+        {"sent": [1, 2], "run": 1, "execution": "JIRA-100"}
+        {"superseded": [3]}
+    Results are never rewritten, successful upload appends marker with sequence numbers of uploaded results,
+    results which must not be uploaded (worse result of the same key was pushed) are marked superseded,
+    so replay uploads only results without marker. Each test run starts with run line, so replay uploads
+    results of the run into test execution of the same run
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._log = logging.getLogger(__name__)
+        self.last_seq = 0
+        self.last_run = 0
+        # run started by this spool, results and markers are written with it
+        self.run = None
+        for line in self._read():
+            self.last_seq = max(self.last_seq, line.get('seq', 0))
+            self.last_run = max(self.last_run, line.get('run') or 0)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _read(self) -> Iterator[dict]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as spool_file:
+            for line in spool_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # the last line could be cut by killed process
+                    self._log.warning('Skipped broken line in spool %s', self.path)
+
+    def _write(self, line: dict) -> None:
+        self._file.write(json.dumps(line) + '\n')
+        self._file.flush()
+
+    def start_run(self, test_plan_key: str = None) -> int:
+        """
+        Method to start test run, following results belong to it
+        Args:
+            test_plan_key: str, test plan of test execution created for the run
+
+        Returns:
+            int, number of the run
+        """
+        with self._lock:
+            self.last_run += 1
+            self.run = self.last_run
+            self._write(dict(run=self.run, test_plan=test_plan_key))
+            return self.run
+
+    def append(self, nodeid: str, test: TestCase) -> int:
+        """
+        Method to store test result
+        Args:
+            nodeid: str, pytest node id of the case
+            test: TestCase, result to store
+
+        Returns:
+            int, sequence number of stored result
+        """
+        with self._lock:
+            self.last_seq += 1
+            self._write(dict(seq=self.last_seq,
+                             run=self.run,
+                             nodeid=nodeid,
+                             test_key=test.test_key,
+                             status=test.status.value,
+                             comment=test.comment))
+            return self.last_seq
+
+    def mark_sent(self, seqs: List[int], execution_key: str, run: int = None) -> None:
+        """
+        Method to store idempotency marker of uploaded results
+        Args:
+            seqs: list, sequence numbers of uploaded results
+            execution_key: str, test execution the results were uploaded to
+            run: int, run of the results, default is the run started by this spool
+        """
+        run = run or self.run
+        # test execution created without results (pre-created one) is kept for replay of the run
+        if not seqs and not run:
+            return
+        with self._lock:
+            self._write(dict(sent=seqs, run=run, execution=execution_key))
+            os.fsync(self._file.fileno())
+
+    def mark_superseded(self, seqs: List[int]) -> None:
+        """
+        Method to store marker of results which are not uploaded, e.g. passed result of parametrized test
+        after failed one of the same Jira key
+        Args:
+            seqs: list, sequence numbers of results
+        """
+        if not seqs:
+            return
+        with self._lock:
+            self._write(dict(superseded=seqs))
+
+    def _pending(self, after_seq: int) -> Iterator[Tuple[Optional[int], TestCase]]:
+        sent = set()
+        latest: Dict[tuple, int] = {}
+        for line in self._read():
+            if 'sent' in line:
+                sent.update(line['sent'])
+            elif 'superseded' in line:
+                sent.update(line['superseded'])
+            elif line.get('seq', 0) > after_seq:
+                latest[line.get('run'), line['nodeid'], line['test_key']] = line['seq']
+        actual = set(latest.values()) - sent
+        for line in self._read():
+            if line.get('seq') in actual:
+                test = TestCase(line['test_key'], line['status'], line['comment'])
+                test.seqs = (line['seq'],)
+                yield line.get('run'), test
+
+    def pending(self, after_seq: int = 0) -> Iterator[TestCase]:
+        """
+        Method to read results which were not uploaded yet. Only the latest result of each node and key
+        of a run is returned. File is read twice, so memory is bounded by number of nodes instead of results size
+        Args:
+            after_seq: int, skip results stored before the sequence number (e.g. by previous runs)
+
+        Returns:
+            iterator of TestCase, `seqs` attribute keeps sequence number of result
+        """
+        return (test for _, test in self._pending(after_seq))
+
+    def pending_runs(self) -> List[Tuple[Optional[int], TestExecution]]:
+        """
+        Method to group results which were not uploaded yet by test runs. Results of each run go to test execution
+        the run uploaded results to, or to new test execution if the run uploaded nothing.
+        Results of spool written before runs were recorded belong to run None
+
+        Returns:
+            list of run and its test execution, in order of runs
+        """
+        tests: Dict[Optional[int], List[TestCase]] = {}
+        for run, test in self._pending(0):
+            tests.setdefault(run, []).append(test)
+        if not tests:
+            return []
+        executions: Dict[Optional[int], str] = {}
+        test_plans: Dict[Optional[int], str] = {}
+        for line in self._read():
+            if 'sent' in line and line.get('execution'):
+                executions[line.get('run')] = line['execution']
+            elif 'run' in line and 'seq' not in line and 'sent' not in line:
+                test_plans[line['run']] = line.get('test_plan')
+        # results of parametrized test are pushed as one test case with the worst status
+        return [(run, TestExecution(test_execution_key=executions.get(run, ''),
+                                    test_plan_key=test_plans.get(run),
+                                    tests=merge_worst(run_tests)))
+                for run, run_tests in sorted(tests.items(), key=lambda item: item[0] or 0)]
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+
+class SpooledPublisher(PublisherWrapper):
+    """
+    Publisher wrapper which writes idempotency markers into spool for every successful upload
+    """
+
+    def __init__(self, publisher: BasePublisher, spool: ResultSpool, run: int = None) -> None:
+        super().__init__(publisher)
+        self._spool = spool
+        # run of uploaded results, default is the run started by spool
+        self._run = run
+
+    def publish(self, test_execution: TestExecution) -> str:
+        key = self._publisher.publish(test_execution)
+        # results printed by dry run stay pending for upload to Jira
+        if key and not self.dry_run:
+            self._spool.mark_sent([seq for test in test_execution.tests for seq in test.seqs], key, self._run)
+        return key
+
+    def close(self) -> None:
+        super().close()
+        self._spool.close()
+
+
+def replay(spool: ResultSpool, publisher: BasePublisher, **chunk_options) -> int:
+    """
+    Upload results which were not uploaded by test run (e.g. Jira was down).
+    Results of each run are uploaded into test execution of the same run
+
+    Args:
+        spool: ResultSpool, spool to replay
+        publisher: publisher to upload results with
+        **chunk_options: max_tests, max_bytes, workers - see BasePublisher.publish_chunked
+
+    Returns:
+        int, number of results uploaded
+    """
+    pending = sum(1 for _ in spool.pending())
+    if not pending:
+        return 0
+    for run, execution in spool.pending_runs():
+        SpooledPublisher(publisher, spool, run).publish_chunked(execution, **chunk_options)
+    return pending - sum(1 for _ in spool.pending())
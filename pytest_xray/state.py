@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import threading
+from typing import Dict, List
+
+from .helper import TestCase, TestExecution
+from .xray_publisher import BasePublisher, PublisherWrapper
+
+CACHE_PREFIX = 'pytest_xray/state/'
+# test executions without test plan share one state
+NO_PLAN = '_'
+
+
+def comment_digest(comment: str) -> str:
+    return hashlib.sha1((comment or '').encode('utf-8')).hexdigest()[:16]
+
+
+class ResultState:
+    """
+    Last pushed state of tests kept in pytest cache (.pytest_cache), one entry per test plan:
+        pytest_xray/state/PLAN-1 = {"JIRA-1": ["PASS", "da39a3ee5e6b4b0d"], ...}
+    """
+
+    def __init__(self, cache) -> None:
+        self._cache = cache
+        self._lock = threading.Lock()
+        self._plans: Dict[str, Dict[str, List[str]]] = {}
+        self._dirty = set()
+
+    def _plan(self, plan_key: str) -> Dict[str, List[str]]:
+        plan_key = plan_key or NO_PLAN
+        if plan_key not in self._plans:
+            self._plans[plan_key] = self._cache.get(CACHE_PREFIX + plan_key, {})
+        return self._plans[plan_key]
+
+    def is_changed(self, plan_key: str, test: TestCase) -> bool:
+        """
+        Method to check if test result differs from the last pushed one
+        Args:
+            plan_key: str, test plan of execution
+            test: TestCase, result
+
+        Returns:
+            bool
+        """
+        with self._lock:
+            return self._plan(plan_key).get(test.test_key) != [test.status.value, comment_digest(test.comment)]
+
+    def record(self, plan_key: str, tests: List[TestCase]) -> None:
+        """
+        Method to store state of pushed results
+        Args:
+            plan_key: str, test plan of execution
+            tests: list, pushed results
+        """
+        with self._lock:
+            state = self._plan(plan_key)
+            for test in tests:
+                state[test.test_key] = [test.status.value, comment_digest(test.comment)]
+            self._dirty.add(plan_key or NO_PLAN)
+
+    def save(self) -> None:
+        with self._lock:
+            for plan_key in self._dirty:
+                self._cache.set(CACHE_PREFIX + plan_key, self._plans[plan_key])
+            self._dirty.clear()
+
+
+class DeltaPublisher(PublisherWrapper):
+    """
+    Publisher wrapper which pushes only results changed since the last successful push into the same test plan.
+    State is updated only after successful upload, with `force` every result is pushed and state is refreshed
+    """
+
+    def __init__(self, publisher: BasePublisher, state: ResultState, force: bool = False) -> None:
+        super().__init__(publisher)
+        self._state = state
+        self._force = force
+        self._log = logging.getLogger(__name__)
+        self.skipped = 0
+
+    def _changed(self, test_execution: TestExecution) -> TestExecution:
+        if self._force:
+            return test_execution
+        plan_key = test_execution.test_plan_key
+        tests = [test for test in test_execution.tests if self._state.is_changed(plan_key, test)]
+        self.skipped += len(test_execution.tests) - len(tests)
+        if len(tests) == len(test_execution.tests):
+            return test_execution
+        changed = TestExecution(test_execution_key=test_execution.test_execution_key,
+                                test_plan_key=test_execution.test_plan_key,
+                                user=test_execution.user,
+                                revision=test_execution.revision,
+                                tests=tests)
+        changed.start_date = test_execution.start_date
+        return changed
+
+    def publish(self, test_execution: TestExecution) -> str:
+        changed = self._changed(test_execution)
+        # execution without tests only creates test execution
+        if not changed.tests and test_execution.tests:
+            self._log.info('All results are unchanged, push is skipped')
+            return test_execution.test_execution_key or ''
+        key = self._publisher.publish(changed)
+        if key:
+            self._state.record(changed.test_plan_key, changed.tests)
+        return key
+
+    def publish_chunked(self, test_execution: TestExecution, **chunk_options) -> str:
+        # unchanged results are filtered out before split, so no chunk is empty
+        changed = self._changed(test_execution)
+        if not changed.tests:
+            self._log.info('All results are unchanged, push is skipped')
+            return test_execution.test_execution_key or ''
+        # chunks are checked again by publish(), which only costs digest of each comment
+        return super().publish_chunked(changed, **chunk_options)
+
+    def close(self) -> None:
+        super().close()
+        self._state.save()
@@ -0,0 +1,249 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional
+
+from .helper import Status, TestExecution
+from .metrics import Metrics
+
+
+class ExecutionBatcher:
+    """
+    Batching stage for interactive pushes. Merges single-test executions into one
+    until size cap (number of tests) or time cap (seconds since first test in batch) is reached
+    """
+
+    def __init__(self, max_size: int = 1, max_delay: float = None):
+        self.max_size = max(max_size or 1, 1)
+        self.max_delay = max_delay
+        self._batch = None
+        self._opened_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._batch.tests) if self._batch else 0
+
+    def time_left(self) -> Optional[float]:
+        """
+        Returns:
+            float, seconds until time cap of current batch, None if batch is empty or there is no time cap
+        """
+        if self._batch is None or self.max_delay is None:
+            return None
+        return max(self._opened_at + self.max_delay - time.monotonic(), 0.0)
+
+    def add(self, test_execution: TestExecution) -> Optional[TestExecution]:
+        """
+        Method to add execution to current batch
+        Args:
+            test_execution: TestExecution, execution to merge
+
+        Returns:
+            TestExecution, batch ready for upload if any cap is reached, None otherwise
+        """
+        if self._batch is None:
+            self._batch = test_execution
+            self._opened_at = time.monotonic()
+        else:
+            self._batch.merge(test_execution)
+        if len(self) >= self.max_size or self.time_left() == 0.0:
+            return self.flush()
+        return None
+
+    def expire(self) -> Optional[TestExecution]:
+        """
+        Returns:
+            TestExecution, batch ready for upload if its time cap is reached, None otherwise
+        """
+        return self.flush() if self.time_left() == 0.0 else None
+
+    def discard(self, test_keys) -> None:
+        """
+        Method to drop results of tests from current batch
+        Args:
+            test_keys: set, Jira keys of tests
+        """
+        if self._batch is None:
+            return
+        self._batch.tests = [test for test in self._batch.tests if test.test_key not in test_keys]
+        if not self._batch.tests:
+            self._batch = None
+
+    def flush(self) -> Optional[TestExecution]:
+        batch, self._batch = self._batch, None
+        return batch
+
+
+class PriorityBatcher:
+    """
+    Batching stage with two lanes: failures (FAIL, ABORTED) are released by `urgent` batcher with low latency,
+    other results are merged into large infrequent batches by `bulk` batcher. Interactive results of a test
+    only get worse, so the newer result drops the older one of the same test waiting in bulk lane
+    """
+    URGENT = (Status.FAIL, Status.ABORTED)
+
+    def __init__(self, urgent: ExecutionBatcher, bulk: ExecutionBatcher):
+        self.urgent = urgent
+        self.bulk = bulk
+
+    def __len__(self) -> int:
+        return len(self.urgent) + len(self.bulk)
+
+    @staticmethod
+    def _merge(*batches: Optional[TestExecution]) -> Optional[TestExecution]:
+        released = [batch for batch in batches if batch is not None]
+        if not released:
+            return None
+        for batch in released[1:]:
+            released[0].merge(batch)
+        return released[0]
+
+    def time_left(self) -> Optional[float]:
+        caps = [cap for cap in (self.urgent.time_left(), self.bulk.time_left()) if cap is not None]
+        return min(caps) if caps else None
+
+    def add(self, test_execution: TestExecution) -> Optional[TestExecution]:
+        """
+        Method to add results to their lanes
+        Args:
+            test_execution: TestExecution, execution to merge
+
+        Returns:
+            TestExecution, results of lanes which reached their caps, None if no lane is ready
+        """
+        self.bulk.discard({test.test_key for test in test_execution.tests})
+        urgent = [test for test in test_execution.tests if test.status in self.URGENT]
+        bulk = [test for test in test_execution.tests if test.status not in self.URGENT]
+        return self._merge(self.urgent.add(test_execution.with_tests(urgent)) if urgent else self.urgent.expire(),
+                           self.bulk.add(test_execution.with_tests(bulk)) if bulk else self.bulk.expire())
+
+    def expire(self) -> Optional[TestExecution]:
+        return self._merge(self.urgent.expire(), self.bulk.expire())
+
+    def flush(self) -> Optional[TestExecution]:
+        return self._merge(self.urgent.flush(), self.bulk.flush())
+
+
+class BackgroundUploader:
+    """
+    Publisher wrapper which uploads test executions from a daemon thread.
+    pytest hooks only put executions into a bounded queue, the worker batches and publishes them
+    in submission order and threads returned test execution key into the following pushes.
+    Once test execution key is known (pre-created or returned by the first push) batches are published
+    by up to `workers` concurrent requests, batches with the same test are still published in order
+    """
+    _STOP = object()
+
+    def __init__(self, publisher, execution_key: str = '', queue_size: int = 0, batcher: ExecutionBatcher = None,
+                 metrics: Metrics = None, workers: int = 1, chunk_options: dict = None):
+        self._publisher = publisher
+        self._metrics = metrics or Metrics(enabled=False)
+        # empty batcher is falsy (__len__), so it is compared with None explicitly
+        self._batcher = batcher if batcher is not None else ExecutionBatcher()
+        # big batches (e.g. bulk lane on the end of session) are uploaded in chunks
+        self._chunk_options = chunk_options
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='xray-upload') if workers > 1 else None
+        # Jira key -> future of the latest push with the test
+        self._pushes = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='xray-uploader', daemon=True)
+        self._log = logging.getLogger(__name__)
+        self.execution_key = execution_key or ''
+        self.published = 0
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def submit(self, test_execution: TestExecution) -> None:
+        """
+        Put execution into upload queue. Blocks while queue is full (backpressure for slow Jira)
+
+        Args:
+            test_execution: TestExecution, execution to upload
+        """
+        self._queue.put(test_execution)
+        self._metrics.observe_max('queue_depth', self._queue.qsize())
+
+    def _send(self, test_execution: TestExecution) -> None:
+        try:
+            if self._chunk_options is not None:
+                key = self._publisher.publish_chunked(test_execution, **self._chunk_options)
+            else:
+                key = self._publisher.publish(test_execution)
+        except Exception:
+            self._log.exception('Background upload failed')
+        else:
+            with self._lock:
+                if key:
+                    self.execution_key = key
+                self.published += 1
+        finally:
+            with self._lock:
+                self._in_flight -= len(test_execution.tests)
+
+    def _publish(self, test_execution: Optional[TestExecution]) -> None:
+        if test_execution is None:
+            return
+        if not test_execution.test_execution_key:
+            test_execution.test_execution_key = self.execution_key
+        with self._lock:
+            self._in_flight += len(test_execution.tests)
+        if self._executor is None or not test_execution.test_execution_key:
+            # the first push creates test execution, the following ones wait for its key
+            self._send(test_execution)
+            return
+        self._pushes = {key: future for key, future in self._pushes.items() if not future.done()}
+        test_keys = {test.test_key for test in test_execution.tests}
+        # later result of a test must not be overwritten by earlier one
+        wait([future for key, future in self._pushes.items() if key in test_keys])
+        future = self._executor.submit(self._send, test_execution)
+        for key in test_keys:
+            self._pushes[key] = future
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self._batcher.time_left())
+            except queue.Empty:
+                # time cap of current batch is reached
+                self._publish(self._batcher.expire())
+                continue
+            try:
+                if item is self._STOP:
+                    self._publish(self._batcher.flush())
+                    if self._executor is not None:
+                        self._executor.shutdown(wait=True)
+                    return
+                self._publish(self._batcher.add(item))
+            finally:
+                self._queue.task_done()
+
+    def stop(self, timeout: float = None) -> int:
+        """
+        Drain upload queue and stop worker
+
+        Args:
+            timeout: float, deadline in seconds for draining, None - wait until queue is empty
+
+        Returns:
+            int, number of test results which were not uploaded before deadline
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        self._thread.join(remaining)
+        if self._thread.is_alive():
+            self._log.warning('Upload queue was not drained in %ss', timeout)
+            queued = sum(len(item.tests) for item in list(self._queue.queue) if item is not self._STOP)
+            return queued + len(self._batcher) + self._in_flight
+        return 0
@@ -1,11 +1,30 @@
+import email.utils
+import itertools
 import logging
-from typing import Union
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple, Union
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import AuthBase
+from urllib3.exceptions import NewConnectionError
 
-from .constant import TEST_EXECUTION_ENDPOINT
+from .constant import (
+    DEFAULT_BREAKER_RESET,
+    DEFAULT_BREAKER_THRESHOLD,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_PREFLIGHT_TIMEOUT,
+    DEFAULT_RATE_BURST,
+    PREFLIGHT_ENDPOINT,
+    TEST_EXECUTION_ENDPOINT,
+)
 from .helper import TestExecution
+from .metrics import Metrics
+from .rate_limit import SharedTokenBucket, default_state_file
+from .serializer import AUTO, compress, get_compression, get_serializer
 
 logging.basicConfig()
 
@@ -14,13 +33,260 @@ class XrayError(Exception):
     """Custom exception for Jira XRAY"""
 
 
-class PrintPublisher:
+class Attempt(NamedTuple):
+    """One HTTP request to Jira: outcome is status code or exception name, delay is backoff before next attempt"""
+    number: int
+    outcome: Union[int, str]
+    latency: float
+    delay: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return isinstance(self.outcome, int) and self.outcome < 400
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter for failures which are safe to retry:
+    rejected requests (429, 503), requests which didn't reach Jira (connection was not established)
+    and, if re-post is idempotent (test execution key is known), gateway errors (502, 504) and any connection error.
+    Request which created test execution could be processed by Jira behind failed gateway, so it isn't repeated
+    """
+    REJECTED_STATUSES = (429, 503)
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, max_attempts: int = 1, backoff_base: float = 0.5, max_backoff: float = 30.0,
+                 total_timeout: float = None):
+        self.max_attempts = max(max_attempts or 1, 1)
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.total_timeout = total_timeout
+
+    @staticmethod
+    def is_connect_error(error: Exception) -> bool:
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def is_retryable_status(self, status_code: int, idempotent: bool) -> bool:
+        return status_code in (self.RETRY_STATUSES if idempotent else self.REJECTED_STATUSES)
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """
+        Retry-After header is either number of seconds or HTTP date
+        """
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(retry_at.timestamp() - time.time(), 0.0)
+
+    def next_delay(self, attempt: int, elapsed: float, retry_after: float = None) -> Optional[float]:
+        """
+        Method to get backoff delay before next attempt
+        Args:
+            attempt: int, number of failed attempt (starts from 1)
+            elapsed: float, seconds spent on all attempts
+            retry_after: float, delay requested by server
+
+        Returns:
+            float, seconds to wait, None if request must not be retried anymore
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            delay = random.uniform(0, min(self.max_backoff, self.backoff_base * 2 ** (attempt - 1)))
+        if self.total_timeout is not None and elapsed + delay > self.total_timeout:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of pushes: opens after `failure_threshold` consecutive failed pushes, so following pushes
+    fail fast instead of waiting for connect timeout. After `reset_timeout` seconds one trial push is allowed
+    (half-open), its success closes the circuit, its failure opens it again. Threshold 0 disables the breaker
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_BREAKER_THRESHOLD, reset_timeout: float = DEFAULT_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """
+        Returns:
+            bool, True if push may be sent
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # half-open: only one trial push at a time
+                self._trial = True
+                return True
+            return False
+
+    def open(self) -> None:
+        with self._lock:
+            self._opened_at = time.monotonic()
+            self._trial = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self.failure_threshold and self.failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+class BasePublisher:
+    """
+    Common part of publishers: collected errors and chunked upload on top of publish()
+    """
+
+    def __init__(self) -> None:
+        self.errors = []
+        self.attempts = []
+        # executions which were not pushed while circuit breaker was open
+        self.deferred = []
+        # dry run publisher only prints executions, its keys are not real test executions
+        self.dry_run = False
+
+    def check_connection(self) -> Optional[str]:
+        """
+        Preflight check of connectivity and credentials
+
+        :return: error description, None if check passed
+        """
+        return None
+
+    def publish(self, test_execution: TestExecution) -> str:
+        raise NotImplementedError
+
+    def map_concurrently(self, function: Callable, items: Iterable, workers: int = 1) -> list:
+        """
+        Call function for each item with up to `workers` concurrent calls
+
+        :param function: function of one argument, e.g. publish
+        :param items: arguments
+        :param workers: max number of concurrent calls
+        :return: results in order of items
+        """
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(function, items))
+        return [function(item) for item in items]
+
+    def publish_many(self, test_executions: Iterable[TestExecution], workers: int = 1) -> List[str]:
+        """
+        Publish several test executions with up to `workers` concurrent requests
+
+        :param test_executions: instances of TestExecution class
+        :param workers: max number of concurrent requests
+        :return: test execution issue ids, empty string for not published execution
+        """
+        return self.map_concurrently(self.publish, test_executions, workers)
+
+    def publish_chunked(self,
+                        test_execution: TestExecution,
+                        max_tests: int = 0,
+                        max_bytes: int = 0,
+                        workers: int = 1) -> str:
+        """
+        Publish results to Jira in chunks. If test execution key is unknown the first chunk creates
+        test execution, the others are uploaded into it with up to `workers` concurrent requests.
+
+        :param test_execution: instance of TestExecution class
+        :param max_tests: max number of tests in one request, 0 - no limit
+        :param max_bytes: max serialized size of tests in one request, 0 - no limit
+        :param workers: max number of concurrent requests
+        :return: test execution issue id
+        """
+        chunks = test_execution.split(max_tests, max_bytes)
+        first = next(chunks, None)
+        if first is None:
+            return self.publish(test_execution)
+        key = test_execution.test_execution_key
+        if not key:
+            key = self.publish(first)
+            if not key:
+                if first in self.deferred:
+                    # circuit breaker is open, remaining chunks wait for Jira as well
+                    self.deferred.extend(chunks)
+                else:
+                    self.errors.append('Test execution was not created, remaining chunks were not uploaded')
+                return ''
+        else:
+            chunks = itertools.chain([first], chunks)
+
+        def publish_chunk(chunk: TestExecution) -> str:
+            chunk.test_execution_key = key
+            return self.publish(chunk)
+
+        self.map_concurrently(publish_chunk, chunks, workers)
+        return key
+
+    def close(self) -> None:
+        pass
+
+
+class PublisherWrapper(BasePublisher):
+    """
+    Base of publishers which add behaviour to wrapped publisher. Errors, attempts and deferred executions are
+    shared with the wrapped publisher, connection check and close are delegated to it
+    """
+
+    def __init__(self, publisher: BasePublisher) -> None:
+        super().__init__()
+        self._publisher = publisher
+        self.errors = publisher.errors
+        self.attempts = publisher.attempts
+        self.deferred = publisher.deferred
+        self.dry_run = publisher.dry_run
+
+    def check_connection(self) -> Optional[str]:
+        return self._publisher.check_connection()
+
+    def publish(self, test_execution: TestExecution) -> str:
+        return self._publisher.publish(test_execution)
+
+    def close(self) -> None:
+        self._publisher.close()
+
+
+class PrintPublisher(BasePublisher):
 
     def __init__(self,
                  base_url: str,
                  auth: Union[AuthBase, tuple],
-                 verify: Union[bool, str] = True) -> None:
-        self.errors = []
+                 verify: Union[bool, str] = True,
+                 **kwargs) -> None:
+        super().__init__()
+        self.dry_run = True
 
     def publish(self, test_execution: TestExecution) -> str:
         import pprint
@@ -29,43 +295,147 @@ class PrintPublisher:
         return "local"
 
 
-class XrayPublisher:
+class XrayPublisher(BasePublisher):
 
     def __init__(self,
                  base_url: str,
                  auth: Union[AuthBase, tuple],
-                 verify: Union[bool, str] = True) -> None:
+                 verify: Union[bool, str] = True,
+                 timeout: Union[float, Tuple[float, float]] = None,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 retry_policy: RetryPolicy = None,
+                 serializer: str = AUTO,
+                 compression: str = None,
+                 metrics: Metrics = None,
+                 breaker: CircuitBreaker = None,
+                 rate_limiter: SharedTokenBucket = None,
+                 concurrency: int = 0) -> None:
+        super().__init__()
         if base_url.endswith('/'):
             base_url = base_url[:-1]
         self.base_url = base_url
         self.auth = auth
         self.verify = verify
+        # float or (connect, read) tuple, see requests timeouts
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._dumps = get_serializer(serializer)
+        # Content-Encoding of request body, not every proxy supports it
+        self.compression = get_compression(compression)
+        self.metrics = metrics or Metrics(enabled=False)
+        self.breaker = breaker or CircuitBreaker()
+        # requests wait for their slot instead of hitting rate limit of Jira and backing off on 429
+        self.rate_limiter = rate_limiter
+        # max number of requests in flight of all threads (upload workers, background pushes), 0 - no limit
+        self.concurrency = max(0, concurrency or 0)
+        self._in_flight = threading.BoundedSemaphore(self.concurrency) if self.concurrency else None
         self._log = logging.getLogger(__name__)
-        self.errors = []
+        # long-living session keeps connections to Jira alive between pushes
+        self._session = requests.Session()
+        # every request in flight needs its own kept-alive connection
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, self.concurrency))
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
 
     @property
     def endpoint_url(self) -> str:
         return self.base_url + TEST_EXECUTION_ENDPOINT
 
+    def check_connection(self, timeout: float = DEFAULT_PREFLIGHT_TIMEOUT) -> Optional[str]:
+        """
+        Preflight check of connectivity and credentials. Failed check opens circuit breaker,
+        so results are deferred instead of waiting for Jira on every push
+
+        :param timeout: connect and read timeout of the check in seconds
+        :return: error description, None if check passed
+        """
+        self._wait_for_rate_limit()
+        try:
+            response = self._send('GET', self.base_url + PREFLIGHT_ENDPOINT, auth=self.auth,
+                                  verify=self.verify, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            error = 'Jira {} is unreachable: {}'.format(self.base_url, type(e).__name__)
+        else:
+            if response.ok:
+                return None
+            if response.status_code in (401, 403):
+                error = 'Jira {} rejected credentials: {}'.format(self.base_url, response.status_code)
+            else:
+                error = 'Jira {} responded {} to preflight check'.format(self.base_url, response.status_code)
+        self.breaker.open()
+        self.errors.append('Preflight check failed. ' + error)
+        return error
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        if self._in_flight is None:
+            return self._session.request(method=method, url=url, **kwargs)
+        with self._in_flight:
+            return self._session.request(method=method, url=url, **kwargs)
+
+    def _wait_for_rate_limit(self) -> None:
+        if self.rate_limiter is not None:
+            waited = self.rate_limiter.acquire()
+            self.metrics.add_time('rate_limit', waited)
+
+    def _record(self, attempt: Attempt) -> None:
+        self.attempts.append(attempt)
+        self.metrics.add_time('network', attempt.latency)
+
     def publish_xray_results(self, url: str, auth: AuthBase, data: dict) -> dict:
         headers = {
             'Accept': 'application/json',
             'Content-Type': 'application/json'
         }
-        try:
-            response = requests.request(method='POST', url=url, headers=headers, json=data,
-                                        auth=auth, verify=self.verify)
-        except requests.exceptions.ConnectionError as e:
-            self._log.exception('ConnectionError to JIRA service %s', self.base_url)
-            raise XrayError(e)
-        else:
+        # body is serialized (and compressed) once and reused by all attempts
+        with self.metrics.timer('serialize'):
+            body = self._dumps(data)
+            if self.compression:
+                body = compress(body, self.compression)
+                headers['Content-Encoding'] = self.compression
+        # re-post into known test execution only updates test runs
+        idempotent = bool(data.get('testExecutionKey'))
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            self._wait_for_rate_limit()
+            attempt_started = time.monotonic()
+            retry_after = None
+            self.metrics.incr('bytes_sent', len(body))
             try:
-                response.raise_for_status()
-            except Exception as e:
-                self._log.error('Could not post to JIRA service %s. Response status code: %s',
-                              self.base_url, response.status_code)
-                raise XrayError from e
-            return response.json()
+                response = self._send('POST', url, headers=headers, data=body,
+                                      auth=auth, verify=self.verify, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                outcome = type(e).__name__
+                retryable = idempotent or self.retry_policy.is_connect_error(e)
+                error = e
+            else:
+                outcome = response.status_code
+                try:
+                    response.raise_for_status()
+                except Exception as e:
+                    retryable = self.retry_policy.is_retryable_status(response.status_code, idempotent)
+                    retry_after = self.retry_policy.parse_retry_after(response.headers.get('Retry-After'))
+                    error = e
+                else:
+                    self._record(Attempt(attempt, outcome, time.monotonic() - attempt_started))
+                    return response.json()
+            now = time.monotonic()
+            delay = self.retry_policy.next_delay(attempt, now - started, retry_after) if retryable else None
+            self._record(Attempt(attempt, outcome, now - attempt_started, delay))
+            if delay is None:
+                break
+            self.metrics.incr('retries')
+            self._log.warning('Attempt %s to post to JIRA service %s failed: %s. Retry in %.2fs',
+                              attempt, self.base_url, outcome, delay)
+            time.sleep(delay)
+
+        if isinstance(outcome, int):
+            self._log.error('Could not post to JIRA service %s. Response status code: %s',
+                            self.base_url, outcome)
+            raise XrayError from error
+        self._log.error('ConnectionError to JIRA service %s', self.base_url, exc_info=error)
+        raise XrayError(error)
 
     def publish(self, test_execution: TestExecution) -> str:
         """
@@ -74,12 +444,68 @@ class XrayPublisher:
         :param test_execution: instance of TestExecution class
         :return: test execution issue id
         """
+        if not self.breaker.allow():
+            self.deferred.append(test_execution)
+            return ''
+        with self.metrics.timer('as_dict'):
+            data = test_execution.as_dict()
         try:
-            result = self.publish_xray_results(self.endpoint_url, self.auth, test_execution.as_dict())
+            result = self.publish_xray_results(self.endpoint_url, self.auth, data)
         except XrayError as e:
             self.errors.append(f"{e}")
+            self.breaker.record_failure()
+            if self.breaker.is_open:
+                self._log.warning('Circuit breaker is open after %s failed pushes, results are deferred',
+                                  self.breaker.failures)
             return ''
         else:
+            self.breaker.record_success()
             key = result['testExecIssue']['key']
             self._log.info('Uploaded results to JIRA XRAY Test Execution: %s', key)
             return key
+
+    def close(self) -> None:
+        """
+        Close pooled connections to Jira
+        """
+        self._session.close()
+
+
+def build_publisher(settings: dict, password: str = None, metrics: Metrics = None) -> BasePublisher:
+    """
+    Function to build publisher from options. Without Jira url executions are printed instead of pushed (dry run)
+    Args:
+        settings: dict, options of publisher: url, username, verify, timeout, pool_size, retry, serializer,
+            compression, breaker, concurrency and rate_limit
+        password: str, password of user
+        metrics: Metrics, metrics of the plugin
+
+    Returns:
+        publisher
+    """
+    url = settings.get('url')
+    username = settings.get('username')
+    options = {}
+    if not url:
+        publisher_class = PrintPublisher
+    else:
+        publisher_class = XrayPublisher
+        options['concurrency'] = settings.get('concurrency') or 0
+        rate_limit = settings.get('rate_limit') or {}
+        if (rate_limit.get('rate') or 0) > 0:
+            options['rate_limiter'] = SharedTokenBucket(rate=rate_limit['rate'],
+                                                        burst=rate_limit.get('burst') or DEFAULT_RATE_BURST,
+                                                        path=rate_limit.get('path') or default_state_file(url))
+    timeout = settings.get('timeout')
+    return publisher_class(base_url=url,
+                           auth=(username, password) if username else None,
+                           verify=settings.get('verify', False),
+                           # (connect, read) tuple is a list after JSON
+                           timeout=tuple(timeout) if isinstance(timeout, list) else timeout,
+                           pool_size=settings.get('pool_size') or DEFAULT_POOL_SIZE,
+                           retry_policy=RetryPolicy(**settings.get('retry', {})),
+                           serializer=settings.get('serializer') or AUTO,
+                           compression=settings.get('compression'),
+                           metrics=metrics,
+                           breaker=CircuitBreaker(**settings.get('breaker', {})),
+                           **options)
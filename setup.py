@@ -24,5 +24,8 @@ setup(
         'requests',
     ],
     include_package_data=True,
-    entry_points={'pytest11': ['pytest-xray-sync = pytest_xray.conftest']},
+    entry_points={
+        'pytest11': ['pytest-xray-sync = pytest_xray.conftest'],
+        'console_scripts': ['pytest-xray-merge = pytest_xray.merge:main'],
+    },
 )
@@ -1,4 +1,8 @@
+import threading
+import time
+
 import pytest
+from flask import jsonify
 
 from .mock_server import MockServer
 
@@ -9,6 +13,37 @@ def http_server():
     server.add_json_response('/rest/raven/2.0/import/execution',
                              {'testExecIssue': {'key': '1000'}},
                              methods=('POST',))
+    server.add_flaky_json_response('/flaky/rest/raven/2.0/import/execution',
+                                   {'testExecIssue': {'key': '1001'}},
+                                   failures=2,
+                                   methods=('POST',))
+    server.add_flaky_json_response('/gateway/rest/raven/2.0/import/execution',
+                                   {'testExecIssue': {'key': '1003'}},
+                                   failures=1,
+                                   methods=('POST',),
+                                   status=504)
+    server.add_json_response('/rest/api/2/myself', {'name': 'jirauser'})
+
+    in_flight = {'now': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def slow_execution():
+        with lock:
+            in_flight['now'] += 1
+            in_flight['peak'] = max(in_flight['peak'], in_flight['now'])
+        time.sleep(0.2)
+        with lock:
+            in_flight['now'] -= 1
+        return jsonify({'testExecIssue': {'key': '1002'}})
+
+    def slow_peak():
+        # peak number of concurrent requests to /slow since the previous call
+        with lock:
+            peak, in_flight['peak'] = in_flight['peak'], 0
+        return jsonify({'peak': peak})
+
+    server.add_callback_response('/slow/rest/raven/2.0/import/execution', slow_execution, methods=('POST',))
+    server.add_callback_response('/slow/peak', slow_peak)
     server.start()
     yield
     server.shutdown_server()
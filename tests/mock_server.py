@@ -37,5 +37,17 @@ class MockServer(Thread):
 
         self.add_callback_response(url, callback, methods=methods)
 
+    def add_flaky_json_response(self, url, serializable, failures=1, methods=('GET',), status=503):
+        """ Respond `status` with Retry-After header to every request except each `failures + 1`-th one """
+        calls = []
+
+        def callback():
+            calls.append(1)
+            if len(calls) % (failures + 1):
+                return 'Service Unavailable', status, {'Retry-After': '0'}
+            return jsonify(serializable)
+
+        self.add_callback_response(url, callback, methods=methods)
+
     def run(self):
         self.app.run(port=self.port)
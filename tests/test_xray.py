@@ -1,4 +1,18 @@
+import gzip
+import json
+import os
 import re
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from pytest_xray import helper, longrepr, serializer
+from pytest_xray.spool import ResultSpool
+from pytest_xray.xray_publisher import BasePublisher, CircuitBreaker, RetryPolicy, XrayPublisher
+from pytest_xray.uploader import BackgroundUploader, ExecutionBatcher, PriorityBatcher
 
 pytest_plugins = 'pytester'
 
@@ -27,3 +41,566 @@ def test_jira_xray_plugin(testdir):
     # result.assert_outcomes(passed=1, failed=1, skipped=1)
     # assert len(result.errlines) == 0
     # assert re.search('Uploaded results to JIRA XRAY', '\n'.join(result.outlines))
+
+
+class RecordingPublisher(BasePublisher):
+
+    def __init__(self):
+        super().__init__()
+        self.published = []
+
+    def publish(self, test_execution):
+        self.published.append(test_execution)
+        return 'EXEC-1'
+
+
+def test_background_uploader_threads_execution_key():
+    publisher = RecordingPublisher()
+    uploader = BackgroundUploader(publisher, queue_size=2)
+    uploader.start()
+    for key in ('JIRA-1', 'JIRA-2', 'JIRA-3'):
+        uploader.submit(helper.TestExecution(tests=[helper.TestCase(key, helper.Status.PASS)]))
+    assert uploader.stop(timeout=5) == 0
+    assert [execution.tests[0].test_key for execution in publisher.published] == ['JIRA-1', 'JIRA-2', 'JIRA-3']
+    assert [execution.test_execution_key for execution in publisher.published] == ['', 'EXEC-1', 'EXEC-1']
+
+
+def test_background_uploader_pushes_concurrently_into_known_execution():
+    class SlowPublisher(RecordingPublisher):
+        def __init__(self):
+            super().__init__()
+            self.lock = threading.Lock()
+            self.in_flight = set()
+            self.peak = 0
+
+        def publish(self, test_execution):
+            keys = {test.test_key for test in test_execution.tests}
+            with self.lock:
+                # pushes of the same key are never in flight together
+                assert not keys & self.in_flight
+                self.in_flight |= keys
+                self.peak = max(self.peak, len(self.in_flight))
+            time.sleep(0.1)
+            with self.lock:
+                self.in_flight -= keys
+            return super().publish(test_execution)
+
+    publisher = SlowPublisher()
+    uploader = BackgroundUploader(publisher, execution_key='EXEC-1', workers=4)
+    uploader.start()
+    for key in ('JIRA-1', 'JIRA-2', 'JIRA-3', 'JIRA-4'):
+        uploader.submit(helper.TestExecution(tests=[helper.TestCase(key, helper.Status.PASS)]))
+    uploader.submit(helper.TestExecution(tests=[helper.TestCase('JIRA-1', helper.Status.FAIL)]))
+    assert uploader.stop(timeout=5) == 0
+    assert 1 < publisher.peak <= 4
+    assert len(publisher.published) == 5
+    assert [(execution.tests[0].test_key, execution.tests[0].status) for execution in publisher.published][-1] == \
+        ('JIRA-1', helper.Status.FAIL)
+    assert {execution.test_execution_key for execution in publisher.published} == {'EXEC-1'}
+
+
+def test_jira_xray_plugin_execution_options(testdir):
+    testdir.makepyfile(test_example_1)
+    result = testdir.runpytest('--xray-sync', '--xr_execution_id', 'EXEC-7', '--xr_testplan', 'PLAN-1')
+    assert "'testExecutionKey': 'EXEC-7'" in result.stdout.str()
+    assert "'testPlanKey': 'PLAN-1'" in result.stdout.str()
+    # dry run publisher returns 'local' as key of created test execution
+    # output is not captured, so prints of uploader threads are not swallowed by capture of running test
+    result = testdir.runpytest('-s', '--xray-sync', '--xr_precreate_execution', 'true', '--xr_interactive_push', 'true',
+                               '--xr_background_push', 'true', '--xr_upload_workers', '4')
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    # empty test execution is created first
+    assert " 'tests': []}" in result.stdout.str()
+    assert result.stdout.str().count("'testExecutionKey': 'local'") == 3
+    # results kept in spool are pushed into pre-created test execution as well
+    spool = str(testdir.tmpdir.join('results.jsonl'))
+    result = testdir.runpytest('-s', '--xray-sync', '--xr_precreate_execution', 'true', '--xr_interactive_push', 'true',
+                               '--xr_spool', spool)
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    assert result.stdout.str().count("'testExecutionKey'") == 3
+    assert result.stdout.str().count("'testExecutionKey': 'local'") == 3
+
+
+def test_jira_xray_plugin_background_push(testdir):
+    testdir.makepyfile(test_example_1)
+    result = testdir.runpytest('--xray-sync', '--xr_interactive_push', 'true', '--xr_background_push', 'true')
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    assert "Report sync finished. Total items: '3'" in result.stdout.str()
+
+
+def test_execution_batcher_size_and_time_caps():
+    batcher = ExecutionBatcher(max_size=2, max_delay=60)
+    assert batcher.add(helper.TestExecution(tests=[helper.TestCase('JIRA-1', helper.Status.PASS)])) is None
+    batch = batcher.add(helper.TestExecution(tests=[helper.TestCase('JIRA-2', helper.Status.FAIL)]))
+    assert [test.test_key for test in batch.tests] == ['JIRA-1', 'JIRA-2']
+
+    batcher = ExecutionBatcher(max_size=100, max_delay=0)
+    batch = batcher.add(helper.TestExecution(tests=[helper.TestCase('JIRA-3', helper.Status.PASS)]))
+    assert [test.test_key for test in batch.tests] == ['JIRA-3']
+    assert batcher.flush() is None
+
+
+def test_priority_batcher_lanes():
+    batcher = PriorityBatcher(urgent=ExecutionBatcher(), bulk=ExecutionBatcher(max_size=3))
+    assert batcher.add(helper.TestExecution(tests=[helper.TestCase('JIRA-1', helper.Status.PASS),
+                                                   helper.TestCase('JIRA-2', helper.Status.PASS)])) is None
+    # failure is released immediately and drops the older result of the same test waiting in bulk lane
+    batch = batcher.add(helper.TestExecution(tests=[helper.TestCase('JIRA-1', helper.Status.FAIL)]))
+    assert [(test.test_key, test.status) for test in batch.tests] == [('JIRA-1', helper.Status.FAIL)]
+    assert len(batcher) == 1
+    assert batcher.add(helper.TestExecution(tests=[helper.TestCase('JIRA-3', helper.Status.PASS)])) is None
+    batch = batcher.add(helper.TestExecution(tests=[helper.TestCase('JIRA-4', helper.Status.PASS)]))
+    assert [test.test_key for test in batch.tests] == ['JIRA-2', 'JIRA-3', 'JIRA-4']
+    assert batcher.flush() is None
+
+
+def test_jira_xray_plugin_priority_lanes(testdir):
+    testdir.makepyfile(test_example_1)
+    # batches are pushed by uploader thread, output is not captured so its prints are not swallowed
+    result = testdir.runpytest('-s', '--xray-sync', '--xr_interactive_push', 'true', '--xr_priority_lanes', 'true')
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    # pass of the first test is pushed on the end of test run, after failures
+    assert re.findall(r"'testKey': '(JIRA-\d+)'", result.stdout.str()) == ['JIRA-2', 'JIRA-5', 'JIRA-1']
+
+
+def test_background_uploader_batches_results():
+    publisher = RecordingPublisher()
+    uploader = BackgroundUploader(publisher, batcher=ExecutionBatcher(max_size=2, max_delay=60))
+    uploader.start()
+    for key in ('JIRA-1', 'JIRA-2', 'JIRA-3'):
+        uploader.submit(helper.TestExecution(tests=[helper.TestCase(key, helper.Status.PASS)]))
+    assert uploader.stop(timeout=5) == 0
+    assert [len(execution.tests) for execution in publisher.published] == [2, 1]
+
+
+def test_jira_xray_plugin_batched_push(testdir):
+    testdir.makepyfile(test_example_1)
+    result = testdir.runpytest('--xray-sync', '--xr_interactive_push', 'true',
+                               '--xr_batch_size', '10', '--xr_batch_interval', '60000')
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    # PrintPublisher prints one execution with all three results
+    assert result.stdout.str().count("'info'") == 1
+
+    # time cap releases batch while the next test is running
+    testdir.makepyfile(test_slow="""
+        import time
+        import pytest
+
+        @pytest.mark.xray('JIRA-1')
+        def test_fast():
+            pass
+
+        @pytest.mark.xray('JIRA-2')
+        def test_slow():
+            time.sleep(1)
+            print('slow test finished')
+    """)
+    result = testdir.runpytest('-s', 'test_slow.py', '--xray-sync', '--xr_interactive_push', 'true',
+                               '--xr_batch_size', '10', '--xr_batch_interval', '100')
+    result.assert_outcomes(passed=2)
+    output = result.stdout.str()
+    assert output.index("'JIRA-1'") < output.index('slow test finished') < output.index("'JIRA-2'")
+
+
+def test_xray_publisher_reuses_session():
+    publisher = XrayPublisher(base_url=os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002'),
+                              auth=('jirauser', 'jirapassword'),
+                              timeout=(5, 30))
+    execution = helper.TestExecution(tests=[helper.TestCase('JIRA-1', helper.Status.PASS)])
+    assert publisher.publish(execution) == '1000'
+    assert publisher.publish(execution) == '1000'
+    assert not publisher.errors
+    publisher.close()
+
+
+def test_jira_xray_plugin_push_to_server(testdir):
+    testdir.makepyfile(test_example_1)
+    result = testdir.runpytest('--xray-sync', '--xr_url', os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002'),
+                               '--xr_timeout', '5,30')
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    assert 'Report sync failed' not in result.stdout.str()
+
+
+def test_publish_chunked_reuses_created_execution():
+    publisher = RecordingPublisher()
+    execution = helper.TestExecution(tests=[helper.TestCase(f'JIRA-{i}', helper.Status.FAIL, 'x' * 100)
+                                            for i in range(10)])
+    assert publisher.publish_chunked(execution, max_tests=4, workers=2) == 'EXEC-1'
+    assert sorted(len(chunk.tests) for chunk in publisher.published) == [2, 4, 4]
+    assert [chunk.test_execution_key for chunk in publisher.published] == [None, 'EXEC-1', 'EXEC-1']
+    # each serialized test is ~150 bytes
+    assert [len(chunk.tests) for chunk in execution.split(max_bytes=400)] == [2, 2, 2, 2, 2]
+    test = helper.TestCase('JIRA-1', helper.Status.FAIL, 'E   assert "a" == \'b\'\n\tC:\\path ✗\r\n')
+    assert test.size() == len(serializer.get_serializer('json')(test.as_dict())) + 1
+
+
+def test_jira_xray_plugin_xdist_single_upload(testdir):
+    pytest.importorskip('xdist')
+    testdir.makepyfile(test_example_1)
+    result = testdir.runpytest_subprocess('--xray-sync', '-n', '2')
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    # workers forward results, only controller prints (pushes) execution
+    assert result.stdout.str().count("'info'") == 1
+    assert "Total items: '3'" in result.stdout.str()
+
+
+def test_spool_replay_uploads_results_once(testdir):
+    testdir.makepyfile(test_example_1)
+    spool = str(testdir.tmpdir.join('results.jsonl'))
+    result = testdir.runpytest('--xray-sync', '--xr_url', 'http://127.0.0.1:1', '--xr_spool', spool)
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    assert '--xr-replay' in result.stdout.str()
+
+    # dry run neither replays nor marks results
+    result = testdir.runpytest('--xr-replay', spool)
+    assert result.ret == 1
+    assert 'Replay requires url' in result.stdout.str()
+    testdir.runpytest('--xray-sync', '--xr_spool', spool, '-k', 'test_fail')
+    assert len(list(ResultSpool(spool).pending())) == 4
+
+    url = os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002')
+    # the next run uploads its subset into its own test execution
+    result = testdir.runpytest('--xray-sync', '--xr_url', url, '--xr_spool', spool, '-k', 'test_pass')
+    result.assert_outcomes(passed=1, deselected=2)
+    # results of the first run are not replayed into test execution of the second one
+    assert [(run, execution.test_execution_key, sorted(test.test_key for test in execution.tests))
+            for run, execution in ResultSpool(spool).pending_runs()] == [(1, '', ['JIRA-1', 'JIRA-2', 'JIRA-5']),
+                                                                          (2, '', ['JIRA-2'])]
+    result = testdir.runpytest('--xr-replay', spool, '--xr_url', url)
+    assert result.ret == 0
+    assert 'Replayed results: 4' in result.stdout.str()
+    result = testdir.runpytest('--xr-replay', spool, '--xr_url', url)
+    assert 'Replayed results: 0' in result.stdout.str()
+
+
+def test_xray_publisher_retries_unavailable_service():
+    base_url = os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002')
+    execution = helper.TestExecution(tests=[helper.TestCase('JIRA-1', helper.Status.PASS)])
+    publisher = XrayPublisher(base_url=base_url + '/flaky', auth=None, retry_policy=RetryPolicy(max_attempts=3))
+    assert publisher.publish(execution) == '1001'
+    assert [attempt.outcome for attempt in publisher.attempts] == [503, 503, 200]
+    assert not publisher.errors
+
+    publisher = XrayPublisher(base_url=base_url + '/flaky', auth=None, retry_policy=RetryPolicy(max_attempts=2))
+    assert publisher.publish(execution) == ''
+    assert [attempt.delay for attempt in publisher.attempts] == [0.0, None]
+    assert len(publisher.errors) == 1
+
+    # gateway timeout is retried only if re-post doesn't create another test execution
+    publisher = XrayPublisher(base_url=base_url + '/gateway', auth=None, retry_policy=RetryPolicy(max_attempts=3))
+    assert publisher.publish(helper.TestExecution(test_execution_key='EXEC-1', tests=execution.tests)) == '1003'
+    assert publisher.publish(execution) == ''
+    assert [attempt.outcome for attempt in publisher.attempts] == [504, 200, 504]
+
+
+@pytest.mark.parametrize('name', ['json', 'orjson'])
+def test_serializer_backends_produce_same_payload(name):
+    payload = helper.TestExecution(tests=[helper.TestCase('JIRA-1', helper.Status.FAIL, 'Ошибка')]).as_dict()
+    body = serializer.get_serializer(name)(payload)
+    assert isinstance(body, bytes)
+    assert json.loads(gzip.decompress(serializer.compress(body, 'gzip'))) == json.loads(json.dumps(payload))
+
+
+def test_datatypes_converter():
+    payload = {'a': 'true', 'b': 'false', 'c': '1.5', 'd': '42', 'e': 'v1.0', 'f': '', 'g': None, 'h': 7, 'i': '1.2.3'}
+    assert helper.datatypes_converter(payload) == {'a': True, 'b': False, 'c': 1.5, 'd': 42, 'e': 'v1.0', 'f': '',
+                                                   'g': None, 'h': 7, 'i': '1.2.3'}
+
+
+@pytest.mark.parametrize('metrics_file', ['metrics.prom', 'metrics.json'])
+def test_jira_xray_plugin_timing_breakdown(testdir, metrics_file):
+    testdir.makepyfile(test_example_1)
+    metrics_path = str(testdir.tmpdir.join(metrics_file))
+    result = testdir.runpytest('--xray-sync', '--xr_url', os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002'),
+                               '--xr_timing_summary', 'true', '--xr_metrics_file', metrics_path)
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    assert 'Timing breakdown' in result.stdout.str()
+    assert 'report_conversion: 3 calls' in result.stdout.str()
+    with open(metrics_path) as metrics:
+        content = metrics.read()
+    if metrics_file.endswith('.prom'):
+        assert 'pytest_xray_calls_total{phase="network"} 1' in content
+        assert re.search(r'^pytest_xray_bytes_sent_total \d+', content, re.M)
+    else:
+        assert json.loads(content)['timers']['network']['calls'] == 1
+
+
+def test_jira_xray_plugin_delta_upload(testdir):
+    testdir.makepyfile(test_example_1)
+    args = ('--xray-sync', '--xr_url', os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002'),
+            '--xr_delta_upload', 'true', '--xr_timing_summary', 'true')
+    result = testdir.runpytest(*args)
+    assert 'network: 1 calls' in result.stdout.str()
+    result = testdir.runpytest(*args)
+    assert 'network:' not in result.stdout.str()
+    assert 'Unchanged results were not pushed: 3' in result.stdout.str()
+    result = testdir.runpytest(*args, '--xr-force-sync')
+    assert 'network: 1 calls' in result.stdout.str()
+
+
+def test_circuit_breaker_opens_after_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    # half-open: one trial push, its failure opens circuit again
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and not breaker.is_open
+
+
+def test_jira_xray_plugin_preflight_defers_results(testdir):
+    testdir.makepyfile(test_example_1)
+    spool = str(testdir.tmpdir.join('results.jsonl'))
+    result = testdir.runpytest('--xray-sync', '--xr_url', 'http://127.0.0.1:1', '--xr_preflight', 'true',
+                               '--xr_interactive_push', 'true', '--xr_spool', spool)
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    assert 'Preflight check failed' in result.stdout.str()
+    assert 'Not uploaded results: 3' in result.stdout.str()
+    # no push waited for unreachable Jira
+    assert 'Requests:' not in result.stdout.str()
+    assert '--xr-replay' in result.stdout.str()
+
+    result = testdir.runpytest('--xray-sync', '--xr_url', os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002'),
+                               '--xr_preflight', 'true')
+    assert 'Preflight check failed' not in result.stdout.str()
+    assert 'Report sync failed' not in result.stdout.str()
+
+
+def test_bounded_comment_matches_longreprtext(testdir):
+    testdir.makepyfile("""
+        def test_long():
+            values = {i: 'value %d' % i for i in range(1000)}
+            assert not values, '\\n'.join(str(i) for i in range(3000))
+
+        def test_short():
+            assert False, 'Not passed'
+    """)
+    reports = [report for report in testdir.inline_run('--showlocals').getreports('pytest_runtest_logreport')
+               if report.when == 'call']
+    for report in reports:
+        text = report.longreprtext
+        expected = text[:2000] + ' TRUNCATED ' + text[-3000:] if len(text) > 5000 else text
+        assert longrepr.capture_comment(report) == expected
+    assert len(reports[0].longreprtext) > 5000
+    assert longrepr.capture_comment(reports[0], head=100, tail=50).startswith(reports[0].longreprtext[:100])
+    assert longrepr.capture_comment(reports[1], mode='signature').endswith(
+        'test_bounded_comment_matches_longreprtext.py:6: AssertionError: Not passed\nassert False')
+
+
+def test_jira_xray_plugin_dedup_failures(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        def connect(port):
+            raise ConnectionError('Connection refused: 127.0.0.1:{}'.format(port))
+
+        @pytest.mark.parametrize('port', [8001, 8002])
+        @pytest.mark.xray('JIRA-1')
+        def test_connect(port):
+            connect(port)
+
+        @pytest.mark.xray('JIRA-2')
+        def test_connect_again():
+            connect(8003)
+
+        @pytest.mark.xray('JIRA-3')
+        def test_fail():
+            assert False, 'Not passed'
+    """)
+    reprec = testdir.inline_run('--xray-sync', '--xr_dedup_failures', 'true')
+    reprec.assertoutcome(failed=4)
+    plugin = reprec.getcall('pytest_sessionfinish').session.config.pluginmanager.get_plugin('JIRA_XRAY')
+    comments = {nodeid.split('::')[-1]: result.comment for (nodeid, _), result in plugin._pytest_report.items()}
+    # traceback is kept for the first failure only
+    assert 'ConnectionError: Connection refused: 127.0.0.1:8001' in comments['test_connect[8001]']
+    assert comments['test_connect[8002]'].startswith('Same failure as JIRA-1 (')
+    assert comments['test_connect_again'] == comments['test_connect[8002]']
+    assert 'AssertionError: Not passed' in comments['test_fail']
+
+
+def test_jira_xray_plugin_merges_results_by_key(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        pytestmark = pytest.mark.xray('JIRA-10')
+
+        @pytest.mark.xray('JIRA-1', 'JIRA-2')
+        @pytest.mark.parametrize('value', [1, 0, 1])
+        def test_value(value):
+            assert value, 'Not passed'
+
+        @pytest.mark.xray('JIRA-2')
+        def test_pass():
+            pass
+    """)
+    reprec = testdir.inline_run('--xray-sync')
+    plugin = reprec.getcall('pytest_sessionfinish').session.config.pluginmanager.get_plugin('JIRA_XRAY')
+    execution = plugin._generate_xray_execution_report(plugin._aggregate_reports())
+    statuses = {test.test_key: test.status for test in execution.tests}
+    assert statuses == {'JIRA-1': helper.Status.FAIL, 'JIRA-2': helper.Status.FAIL, 'JIRA-10': helper.Status.FAIL}
+    assert 'Not passed' in execution.tests[0].comment
+
+
+def test_jira_xray_plugin_interactive_push_keeps_worst_status(testdir):
+    testdir.makepyfile("""
+        import pytest
+
+        @pytest.mark.xray('JIRA-1')
+        @pytest.mark.parametrize('value', [1, 0, 1])
+        def test_value(value):
+            assert value, 'Not passed'
+    """)
+    spool = str(testdir.tmpdir.join('results.jsonl'))
+    for options in ((), ('--xr_spool', spool)):
+        result = testdir.runpytest('--xray-sync', '--xr_interactive_push', 'true', *options)
+        result.assert_outcomes(passed=2, failed=1)
+        # the last passed run is not pushed over failed one
+        assert result.stdout.str().count("'info'") == 2
+    # nor by replay of spool, results printed by dry run stay pending except the superseded one
+    assert [test.status for test in ResultSpool(spool).pending()] == [helper.Status.PASS, helper.Status.FAIL]
+
+
+def test_jira_xray_plugin_collection_cache(testdir):
+    test_file = testdir.makepyfile(test_example_1)
+    cache_file = testdir.tmpdir.join('.pytest_cache', 'v', 'pytest_xray', 'markers')
+
+    def pushed_keys(*args):
+        reprec = testdir.inline_run('--xray-sync', '--xr_collection_cache', 'true', *args)
+        plugin = reprec.getcall('pytest_sessionfinish').session.config.pluginmanager.get_plugin('JIRA_XRAY')
+        return sorted(key for _, key in plugin._pytest_report)
+
+    assert pushed_keys() == ['JIRA-1', 'JIRA-2', 'JIRA-5']
+    # keys of unchanged module are taken from cache
+    cache = json.loads(cache_file.read())
+    cache[str(test_file)]['keys']['test_jira_xray_plugin_collection_cache.py::test_pass'] = ['JIRA-100']
+    cache_file.write(json.dumps(cache))
+    assert pushed_keys() == ['JIRA-100', 'JIRA-2', 'JIRA-5']
+    assert pushed_keys('--xr-cache-clear') == ['JIRA-1', 'JIRA-2', 'JIRA-5']
+
+
+def test_jira_xray_plugin_lazy_import():
+    code = ('import sys, pytest_xray.conftest\n'
+            'print(sorted(m for m in ("requests", "pytest_xray.plugin", "pytest_xray.xray_publisher") if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    assert output.stdout.strip() == '[]'
+
+
+def test_publisher_concurrency_limits_requests_in_flight():
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    base_url = os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002')
+    requests.get(base_url + '/slow/peak')
+    # every request to /slow takes 200 ms
+    publisher = XrayPublisher(base_url=base_url + '/slow', auth=('jirauser', 'jirapassword'), concurrency=2)
+    executions = [helper.TestExecution(test_execution_key='EXEC-1',
+                                       tests=[helper.TestCase(f'JIRA-{run}-{i}', helper.Status.PASS) for i in range(3)])
+                  for run in range(3)]
+    # chunked uploads of several threads share the limit of the publisher
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        keys = list(executor.map(lambda execution: publisher.publish_chunked(execution, max_tests=1, workers=3),
+                                 executions))
+    assert keys == ['EXEC-1'] * 3
+    assert len(publisher.attempts) == 9
+    assert not publisher.errors
+    assert 1 < requests.get(base_url + '/slow/peak').json()['peak'] <= 2
+    publisher.close()
+
+
+def test_jira_xray_plugin_concurrency(testdir):
+    testdir.makepyfile(test_example_1)
+    result = testdir.runpytest('--xray-sync', '--xr_url', os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002'),
+                               '--xr_concurrency', '2', '--xr_upload_workers', '4', '--xr_chunk_size', '1')
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    assert 'Report sync failed' not in result.stdout.str()
+
+
+def test_jira_xray_plugin_sidecar_upload(testdir, capsys):
+    from pytest_xray import sidecar
+
+    testdir.makepyfile(test_example_1)
+    directory = str(testdir.tmpdir.join('sidecar'))
+    result = testdir.runpytest('--xray-sync', '--xr_url', os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002'),
+                               '--xr_username', 'jirauser', '--xr_password', 'jirapassword',
+                               '--xr_sidecar', 'true', '--xr_sidecar_dir', directory)
+    result.assert_outcomes(passed=1, failed=1, skipped=1)
+    assert 'handed to sidecar process' in result.stdout.str()
+    jobs = sidecar.wait(directory, timeout=30)
+    assert [(job['state'], job['execution_key'], job['results']) for job in jobs] == [('done', '1000', 3)]
+    # password is passed through stdin only
+    with open(jobs[0]['path']) as job_file:
+        assert 'jirapassword' not in job_file.read()
+    assert os.stat(jobs[0]['path']).st_mode & 0o777 == 0o600
+    assert sidecar.main(['status', '--dir', directory]) == 0
+    assert 'done' in capsys.readouterr().out
+    assert sidecar.main(['clean', '--dir', directory]) == 0
+    assert sidecar.jobs(directory) == []
+
+
+def test_shard_result_files_merge_and_upload(testdir):
+    from pytest_xray import merge
+
+    testdir.makepyfile(test_shard_1=test_example_1, test_shard_2="""
+        import pytest
+
+        @pytest.mark.xray('JIRA-1')
+        def test_pass_in_shard_1_fails_here():
+            assert False
+
+        @pytest.mark.xray('JIRA-3')
+        def test_pass():
+            pass
+    """)
+    shards = []
+    for index in (1, 2):
+        shard = str(testdir.tmpdir.join(f'shard-{index}.jsonl.gz'))
+        result = testdir.runpytest(f'test_shard_{index}.py', '--xray-sync', '--xr_result_file', shard,
+                                   '--xr_testplan', 'PLAN-1')
+        assert 'results are written to' in result.stdout.str()
+        shards.append(shard)
+    execution = merge.merge_result_files(shards)
+    assert [(test.test_key, test.status) for test in execution.tests] == [
+        ('JIRA-1', helper.Status.FAIL), ('JIRA-2', helper.Status.FAIL), ('JIRA-5', helper.Status.ABORTED),
+        ('JIRA-3', helper.Status.PASS)]
+    assert execution.test_plan_key == 'PLAN-1'
+    url = os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002')
+    assert merge.main(shards + ['--url', url, '--chunk-size', '1', '--workers', '4']) == 0
+
+
+def test_rate_limit_is_shared_by_processes(testdir):
+    from pytest_xray.rate_limit import SharedTokenBucket
+    from pytest_xray.xray_publisher import build_publisher
+
+    path = str(testdir.tmpdir.join('rate.json'))
+    code = ('import sys, time\n'
+            'from pytest_xray.rate_limit import SharedTokenBucket\n'
+            'bucket = SharedTokenBucket(rate=20, path=sys.argv[1])\n'
+            'for _ in range(5):\n'
+            '    bucket.acquire()\n'
+            '    print(time.time())\n')
+    processes = [subprocess.Popen([sys.executable, '-c', code, path], stdout=subprocess.PIPE, universal_newlines=True)
+                 for _ in range(2)]
+    sent = sorted(float(line) for process in processes for line in process.communicate()[0].split())
+    # requests of both processes are spread by 1/rate: 0.45s, per process limits would take 0.2s
+    assert len(sent) == 10
+    assert sent[-1] - sent[0] > 0.4
+
+    # backlog longer than rate + burst keeps its slots
+    bucket = SharedTokenBucket(rate=1, burst=1, path=str(testdir.tmpdir.join('backlog.json')))
+    waits = [bucket._reserve_shared() for _ in range(6)]
+    assert [round(wait) for wait in waits] == [0, 1, 2, 3, 4, 5]
+
+    url = os.environ.get('XRAY_API_BASE_URL', 'http://127.0.0.1:5002')
+    publisher = build_publisher(dict(url=url, rate_limit=dict(rate=20, burst=2, path=path)))
+    executions = [helper.TestExecution(tests=[helper.TestCase(f'JIRA-{i}', helper.Status.PASS)]) for i in range(4)]
+    started = time.monotonic()
+    assert publisher.publish_many(executions) == ['1000'] * 4
+    # 2 requests of burst, then one request per 50 ms
+    assert time.monotonic() - started >= 0.09
+    publisher.close()